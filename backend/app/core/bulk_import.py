@@ -0,0 +1,177 @@
+"""
+Offline bulk enrollment of missing-person photos.
+
+Reads either a directory of images (one person per file, named after the
+file) or a CSV manifest with the Person columns plus an `img` column holding
+a path relative to the CSV and an optional unique `key` column (default: the
+row number). Photos are decoded and embedded across a process
+pool and inserted with insert_many. Finished keys are appended to a state
+file so an interrupted import resumes where it stopped; records that fail
+(unreadable file, no face, ...) go to an NDJSON error report and are retried
+on the next run. Run from backend/:
+
+    python -m app.core.bulk_import ./photos --workers 4
+    python -m app.core.bulk_import people.csv --report errors.ndjson
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from app.core.config import BULK_INSERT_BATCH, CPU_COUNT, FACE_DETECTOR
+from app.core.database import connect_to_mongo
+from app.core.enrollment import enroll_record, insert_people
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# Per-process detection stage, built once by the pool initializer
+_detection = None
+
+
+def _init_worker(detector: str, threads: int):
+    """Size every thread pool to this process's share of the CPUs, then load the models"""
+    global _detection
+    import cv2
+    from threadpoolctl import threadpool_limits
+
+    from ml.detection import DetectionStage
+    from ml.registry import registry
+
+    cv2.setNumThreads(threads)
+    threadpool_limits(threads)
+    registry.threads = threads
+    registry.warm_up(["arcface", "mtcnn"] if detector == "mtcnn" else ["arcface"])
+    _detection = DetectionStage(detector=detector)
+
+
+def _enroll_file(key: str, record: dict) -> Tuple[str, Optional[dict], Optional[str]]:
+    """Runs in a pool process; errors are returned rather than raised"""
+    try:
+        if not record["path"]:
+            raise ValueError("no img path")
+        with open(record["path"], "rb") as f:
+            img_data = f.read()
+        return key, enroll_record(_detection, record, img_data), None
+    except Exception as e:
+        return key, None, str(e)
+
+
+def scan_directory(root: str) -> List[Tuple[str, dict]]:
+    """(key, record) for every image below root; the name comes from the file name"""
+    records = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, filename)
+            name = stem.replace("_", " ").strip()
+            records.append((os.path.relpath(path, root), {"name": name, "path": path}))
+    return records
+
+
+def read_manifest(path: str) -> List[Tuple[str, dict]]:
+    """
+    (key, record) per CSV row; the key is the row's `key` column, or its row
+    number, since img paths may repeat or be empty
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    records, seen = [], set()
+    with open(path, newline="") as f:
+        for number, row in enumerate(csv.DictReader(f), start=1):
+            key = (row.get("key") or "").strip() or str(number)
+            if key in seen:
+                raise SystemExit(f"Duplicate key '{key}' in {path} (row {number})")
+            seen.add(key)
+            img = (row.get("img") or "").strip()
+            record = {k: v for k, v in row.items() if k not in ("img", "key")}
+            record["path"] = os.path.join(base, img) if img else ""
+            records.append((key, record))
+    return records
+
+
+def load_done(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+async def run_import(records: List[Tuple[str, dict]], workers: int, batch_size: int,
+                     detector: str, state_path: str, report_path: str):
+    done = load_done(state_path)
+    todo = [(key, record) for key, record in records if key not in done]
+    print(f"📥 {len(todo)} to import ({len(records) - len(todo)} already done)")
+    if not todo:
+        return
+
+    await connect_to_mongo()
+    loop = asyncio.get_running_loop()
+    names = dict(todo)
+    inserted = failed = 0
+    start = time.perf_counter()
+
+    threads = max(1, CPU_COUNT // workers)
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(detector, threads)) as pool, \
+            open(state_path, "a") as state, open(report_path, "a") as report:
+
+        def submit(batch):
+            return [loop.run_in_executor(pool, _enroll_file, key, record)
+                    for key, record in batch]
+
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        pending = submit(batches[0])
+        for i in range(len(batches)):
+            results = await asyncio.gather(*pending)
+            # Embed the next batch while this one is written
+            pending = submit(batches[i + 1]) if i + 1 < len(batches) else []
+
+            errors = [(key, error) for key, doc, error in results if error]
+            ok = [(key, doc) for key, doc, error in results if not error]
+            try:
+                await insert_people(doc for _, doc in ok)
+            except Exception as e:
+                errors += [(key, f"insert failed: {e}") for key, _ in ok]
+                ok = []
+
+            state.writelines(f"{key}\n" for key, _ in ok)
+            state.flush()
+            report.writelines(
+                json.dumps({"key": key, "name": names[key].get("name"), "error": error}) + "\n"
+                for key, error in errors)
+            report.flush()
+            inserted += len(ok)
+            failed += len(errors)
+            rate = (inserted + failed) / (time.perf_counter() - start)
+            print(f"🔄 {inserted} inserted, {failed} failed ({rate:.1f} photos/s)")
+
+    print(f"✅ Imported {inserted} people, {failed} failed"
+          + (f" (see {report_path})" if failed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll missing-person photos")
+    parser.add_argument("source", help="directory of images or CSV manifest")
+    parser.add_argument("--workers", type=int, default=CPU_COUNT)
+    parser.add_argument("--batch-size", type=int, default=BULK_INSERT_BATCH)
+    parser.add_argument("--detector", default=FACE_DETECTOR)
+    parser.add_argument("--state", default="bulk_import.state",
+                        help="keys already imported; delete to start over")
+    parser.add_argument("--report", default="bulk_import_errors.ndjson")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        records = scan_directory(args.source)
+    else:
+        records = read_manifest(args.source)
+    asyncio.run(run_import(records, args.workers, args.batch_size, args.detector,
+                           args.state, args.report))
+
+
+if __name__ == "__main__":
+    main()
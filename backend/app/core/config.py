@@ -4,3 +4,126 @@ from dotenv import load_dotenv
 load_dotenv()  # load .env
 
 MONGO_URI = os.getenv("MONGODB_URI")
+
+# CPUs this process may run on (a pinned gunicorn worker sees only its share)
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 2
+
+# Face detector used by the shared detection stage: "retinaface" or "mtcnn"
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "retinaface").lower()
+
+# RetinaFace input size (a multiple of 32). With DET_SIZE_MODE=adaptive each
+# session/stream picks from DET_SIZES by recent face size, keeping the
+# smallest face at least DET_MIN_FACE_PX tall at the detector input.
+# WebSocket clients can override it with ?det_size=320 or ?det_size=adaptive
+DET_SIZE = int(os.getenv("DET_SIZE", 640))
+DET_SIZE_MODE = os.getenv("DET_SIZE_MODE", "fixed").lower()
+DET_SIZES = tuple(int(s) for s in os.getenv("DET_SIZES", "320,480,640").split(","))
+DET_MIN_FACE_PX = int(os.getenv("DET_MIN_FACE_PX", 48))
+
+# Inference worker pool: threads running decode/detection/embedding, and how
+# many extra jobs may wait for a thread before new work is shed
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", CPU_COUNT))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 8))
+# Seconds an HTTP request waits for a free slot before answering 503
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv("INFERENCE_QUEUE_TIMEOUT", 10))
+
+# Cross-session embedding batching: crops arriving within this window (ms)
+# share one recognition call. 0 disables batching.
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", 10))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 32))
+
+# Minimum cosine similarity for a face to count as a match
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", 0.4))
+
+# Face index backend: "exact" (brute-force matrix multiply) or "ivf"
+# (approximate inverted file, for very large galleries)
+FACE_INDEX = os.getenv("FACE_INDEX", "exact").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", 1024))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+IVF_TRAIN_SIZE = int(os.getenv("IVF_TRAIN_SIZE", 100_000))
+# Where trained IVF centroids are persisted between restarts
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", "./embeddings/face_index.npz")
+
+# Per-session face tracking: stable tracks reuse their embedding and are only
+# re-recognised every TRACK_RECHECK_FRAMES frames. 0 disables tracking.
+TRACK_RECHECK_FRAMES = int(os.getenv("TRACK_RECHECK_FRAMES", 10))
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", 0.3))
+
+# Where alert snapshots and the alert log are written
+ALERTS_DIR = os.getenv("ALERTS_DIR", "./data/alerts")
+# Alert delivery: comma-separated sinks (file, webhook, mongo), repeat
+# alerts for the same person and camera suppressed for ALERT_COOLDOWN_SECONDS
+ALERT_SINKS = [s.strip() for s in os.getenv("ALERT_SINKS", "file").lower().split(",") if s.strip()]
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL")
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", 30))
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", 64))
+
+# CCTV ingestion: optional JSON stream list loaded at startup, and the number
+# of threads running detection/recognition shared by all streams
+STREAMS_CONFIG = os.getenv("STREAMS_CONFIG")
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", CPU_COUNT))
+# Sources POST /api/streams may open: URL schemes, the camera hosts (empty:
+# no network source, so the server cannot be pointed at internal URLs; "*":
+# any host), and whether local files / device indexes are allowed at all
+STREAM_SCHEMES = [s.strip().lower() for s in os.getenv("STREAM_SCHEMES", "rtsp,rtsps,http,https").split(",") if s.strip()]
+STREAM_HOSTS = [h.strip().lower() for h in os.getenv("STREAM_HOSTS", "").split(",") if h.strip()]
+STREAM_ALLOW_LOCAL = os.getenv("STREAM_ALLOW_LOCAL", "0") == "1"
+
+# Motion gating before detection: static frames are skipped, with a full
+# detection forced every MOTION_MAX_SKIP frames. MOTION_GATE=0 disables it.
+MOTION_GATE = os.getenv("MOTION_GATE", "1") == "1"
+MOTION_MIN_AREA = float(os.getenv("MOTION_MIN_AREA", 0.002))
+MOTION_MAX_SKIP = int(os.getenv("MOTION_MAX_SKIP", 10))
+
+# How Person.embedding is packed in MongoDB: float32, float16 or int8
+EMBEDDING_CODEC = os.getenv("EMBEDDING_CODEC", "float32").lower()
+
+# Content-addressed store for person photos and their cached thumbnails
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "./data/images")
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "./data/thumbnails")
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 256))
+
+# Detection/embedding results cached by image content: megabytes kept in
+# memory (LRU), plus an optional directory that keeps them across restarts
+EMBED_CACHE_MB = float(os.getenv("EMBED_CACHE_MB", 64))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")
+
+# Gallery cache refresh when MongoDB change streams are unavailable
+# (standalone server, no replica set)
+GALLERY_POLL_SECONDS = float(os.getenv("GALLERY_POLL_SECONDS", 30))
+
+# Bulk enrollment: documents per insert_many call
+BULK_INSERT_BATCH = int(os.getenv("BULK_INSERT_BATCH", 100))
+
+# When models are loaded: "startup" (warm up before serving), "background"
+# (serve at once, /api/ready is 503 until warm) or "lazy" (first request)
+MODEL_LOAD = os.getenv("MODEL_LOAD", "startup")
+
+# Multi-worker deployments: directory for the memory-mapped gallery snapshot
+# shared by all workers (one worker loads MongoDB and publishes it). Unset
+# keeps a private in-process index (FACE_INDEX) per worker.
+GALLERY_SHARED_DIR = os.getenv("GALLERY_SHARED_DIR")
+# ONNX Runtime intra-op threads per session. A process has one detection and
+# one recognition session shared by all inference threads, and concurrent runs
+# share the session's single pool, so each defaults to the process's whole CPU
+# share. Recognition can be sized separately: with the embedding batcher every
+# batch runs on one thread. 0 keeps the library default.
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", CPU_COUNT))
+ORT_REC_INTRA_OP_THREADS = int(os.getenv("ORT_REC_INTRA_OP_THREADS", ORT_INTRA_OP_THREADS))
+# Other ONNX Runtime session options; the defaults are the library's own.
+# Graph optimization: disable, basic, extended or all. Execution mode:
+# sequential or parallel (inter-op threads only matter when parallel).
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", 0))
+ORT_GRAPH_OPTIMIZATION = os.getenv("ORT_GRAPH_OPTIMIZATION", "all")
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")
+ORT_CPU_ARENA = os.getenv("ORT_CPU_ARENA", "1") == "1"
+ORT_MEM_PATTERN = os.getenv("ORT_MEM_PATTERN", "1") == "1"
+# Directory of int8 models written by `python -m ml.quantize`; models found
+# there replace their fp32 versions. Unset loads fp32 only.
+ORT_QUANTIZED_DIR = os.getenv("ORT_QUANTIZED_DIR", "")
+
+# Opt-in profiling: frames slower than this (ms) get their sampled inference
+# stacks written to PROFILE_DIR/slow_frames.folded. 0 disables sampling.
+PROFILE_SLOW_FRAME_MS = float(os.getenv("PROFILE_SLOW_FRAME_MS", 0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
@@ -3,9 +3,17 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.model import Person
 from app.core.config import MONGO_URI
 
+db = None
+
 
 async def connect_to_mongo():
+    global db
     client = AsyncIOMotorClient(MONGO_URI)
     db = client.get_default_database()
     await init_beanie(database=db, document_models=[Person])
     print("✅ MongoDB connected")
+
+
+def person_collection():
+    """Raw motor collection behind the Person model"""
+    return db[Person.get_collection_name()]
@@ -0,0 +1,114 @@
+import base64
+from typing import Iterable, List, Optional
+
+from beanie import PydanticObjectId
+
+from app.core.config import EMBEDDING_CODEC
+from app.core.image_store import image_store
+from app.models.codec import encode_embedding
+from app.models.model import Person
+from ml.detection import FaceDetections
+from ml.embedding_cache import content_digest, embedding_cache
+from ml.frames import decode_jpeg
+
+PERSON_FIELDS = ("name", "age", "last_seen_data", "phone_number",
+                 "last_seen_location", "add_info")
+
+
+class EnrollmentError(ValueError):
+    """A record that cannot be enrolled (bad image, no face, ...)"""
+
+
+def person_fields(record: dict) -> dict:
+    """Descriptive Person fields from a loosely-typed record (CSV row, JSON line)"""
+    if not str(record.get("name") or "").strip():
+        raise EnrollmentError("Missing name")
+    return {field: str(record.get(field) or "") for field in PERSON_FIELDS}
+
+
+def detect_for_enrollment(detection, img, landmarks=None, aligned: bool = False):
+    """
+    Faces in an enrollment photo: from the detector, from client landmarks
+    (one face's five [x, y] points) or, when aligned, the photo is itself an
+    aligned crop and goes straight to the recognition model
+    """
+    if aligned:
+        return detection.process_aligned([img])
+    if landmarks is not None:
+        return detection.process_faces(img, landmarks)
+    return detection.process(img)
+
+
+def detect_photo(detection, img_data: bytes, digest: str, landmarks=None,
+                 aligned: bool = False) -> FaceDetections:
+    """
+    Faces in an encoded photo. Detector results are cached by the photo's
+    content digest, so a resubmitted photo is neither decoded nor embedded.
+    """
+    key = None if landmarks is not None or aligned else f"{digest}/{detection.variant}"
+    if key is not None:
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            return FaceDetections(**cached)
+    try:
+        img = decode_jpeg(img_data)
+    except Exception as e:
+        raise EnrollmentError(f"Invalid image data: {e}")
+    try:
+        detections = detect_for_enrollment(detection, img, landmarks, aligned)
+    except ValueError as e:
+        # Malformed landmarks or a crop of the wrong size
+        raise EnrollmentError(str(e))
+    if key is not None:
+        embedding_cache.put(key, {"boxes": detections.boxes, "embeddings": detections.embeddings,
+                                  "scores": detections.scores, "landmarks": detections.landmarks})
+    return detections
+
+
+def detect_upload(detection, data: str, landmarks=None, aligned: bool = False):
+    """Base64 upload -> (image bytes, content digest, faces)"""
+    try:
+        img_data = base64.b64decode(data.split(",")[-1])
+    except Exception as e:
+        raise EnrollmentError(f"Invalid image data: {e}")
+    digest = content_digest(img_data)
+    return img_data, digest, detect_photo(detection, img_data, digest, landmarks, aligned)
+
+
+def embed_photo(detection, img_data: bytes, landmarks=None, aligned: bool = False) -> dict:
+    """Decode, embed and store one photo; returns the Person fields it fills in"""
+    digest = content_digest(img_data)
+    detections = detect_photo(detection, img_data, digest, landmarks, aligned)
+    if len(detections) == 0:
+        raise EnrollmentError("No face detected in image")
+    return {
+        "img": None,
+        "img_id": image_store.put(img_data, digest),
+        "embedding": encode_embedding(detections.embeddings[detections.largest()], EMBEDDING_CODEC),
+    }
+
+
+def enroll_record(detection, record: dict, img_data: Optional[bytes] = None) -> dict:
+    """
+    Person document for one record.
+    The photo is img_data when given, otherwise the record's base64 img field;
+    optional landmarks / aligned fields skip detection as in POST /person.
+    """
+    fields = person_fields(record)
+    if img_data is None:
+        if not record.get("img"):
+            raise EnrollmentError("Missing image")
+        try:
+            img_data = base64.b64decode(str(record["img"]).split(",")[-1])
+        except Exception as e:
+            raise EnrollmentError(f"Invalid image data: {e}")
+    return {**fields, **embed_photo(detection, img_data, record.get("landmarks"),
+                                    bool(record.get("aligned")))}
+
+
+async def insert_people(docs: Iterable[dict]) -> List[Person]:
+    """insert_many a batch; ids are assigned up front so callers can index them"""
+    people = [Person(id=PydanticObjectId(), **doc) for doc in docs]
+    if people:
+        await Person.insert_many(people)
+    return people
@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.core.config import INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE
+
+
+class InferenceBusy(Exception):
+    """Raised when the inference queue is full"""
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for CPU-bound decode and inference work.
+    At most max_workers jobs run and max_queue more may wait; anything beyond
+    that either waits for a slot (push back) or is rejected (shed load).
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference")
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    def _release(self, _future=None):
+        self.pending -= 1
+        self._slots.release()
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """
+        Run fn(*args) on the pool and await its result.
+        timeout=None waits for a slot, timeout=0 sheds immediately when full,
+        otherwise InferenceBusy is raised after waiting timeout seconds.
+        """
+        slots = self._semaphore()
+        if timeout == 0:
+            if slots.locked():
+                raise InferenceBusy("Inference queue is full")
+            await slots.acquire()
+        else:
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise InferenceBusy("Timed out waiting for inference slot")
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the thread finishes, even if the caller is cancelled
+        future.add_done_callback(
+            lambda f: loop.call_soon_threadsafe(self._release, f))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
@@ -0,0 +1,246 @@
+import asyncio
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.core.config import (
+    FACE_INDEX,
+    FACE_INDEX_PATH,
+    GALLERY_POLL_SECONDS,
+    GALLERY_SHARED_DIR,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_TRAIN_SIZE,
+)
+from app.models.model import Person, PersonEmbedding
+from ml.face_index import FaceIndex
+from ml.ivf_index import IVFIndex
+from ml.shared_index import SharedFaceIndex, acquire_writer_lock, write_snapshot
+
+GALLERY_PROJECTION = {"name": 1, "embedding": 1}
+
+
+def create_face_index():
+    if GALLERY_SHARED_DIR:
+        return SharedFaceIndex(GALLERY_SHARED_DIR)
+    if FACE_INDEX == "ivf":
+        if os.path.exists(FACE_INDEX_PATH):
+            return IVFIndex.load(FACE_INDEX_PATH)
+        return IVFIndex(nlist=IVF_NLIST, nprobe=IVF_NPROBE, train_size=IVF_TRAIN_SIZE)
+    if FACE_INDEX == "exact":
+        return FaceIndex()
+    raise ValueError(f"Unknown face index '{FACE_INDEX}', expected 'exact' or 'ivf'")
+
+
+class GalleryCache:
+    """
+    Process-level cache of every enrolled embedding.
+    Loaded once at startup and kept fresh from a MongoDB change stream; on a
+    server without a replica set it polls for new and deleted documents
+    instead. Works with any motor-compatible collection.
+
+    With a SharedFaceIndex (multi-worker deployments) only the process
+    holding the writer lock reads MongoDB: it keeps the full gallery in a
+    private FaceIndex and publishes it as a memory-mapped snapshot that all
+    workers search.
+    """
+
+    def __init__(self, index, poll_seconds: float = 30):
+        self.index = index
+        self.names = index.names if isinstance(index, SharedFaceIndex) else {}
+        self.poll_seconds = poll_seconds
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        # Writer only: the full gallery that snapshots are published from
+        self._source: Optional[FaceIndex] = None
+        self._source_names: Dict[str, str] = {}
+        self._publish_task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    @property
+    def shared(self) -> bool:
+        return isinstance(self.index, SharedFaceIndex)
+
+    @property
+    def is_writer(self) -> bool:
+        return self._source is not None
+
+    @property
+    def _store(self):
+        """Index and names that database changes are applied to"""
+        if self._source is not None:
+            return self._source, self._source_names
+        return self.index, self.names
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, id: str) -> Optional[Tuple[str, np.ndarray]]:
+        """(name, normalized embedding) for a person, without touching the database"""
+        embedding = self.index.get(id)
+        if embedding is None:
+            return None
+        return self.names.get(id), embedding
+
+    def upsert(self, doc: dict):
+        """Index a raw Person document (only name and embedding are read)"""
+        if doc.get("embedding") is None:
+            self.remove(str(doc["_id"]))
+            return
+        entry = PersonEmbedding.model_validate(doc)
+        id = str(entry.id)
+        index, names = self._store
+        index.add(id, entry.embedding_array)
+        names[id] = entry.name
+        self._changed()
+
+    def add_person(self, person: Person):
+        """Index a Person inserted by this process without waiting for the change stream"""
+        if person.embedding is None:
+            return
+        id = str(person.id)
+        self.index.add(id, person.embedding_array)
+        self.names[id] = person.name
+        if self._source is not None:
+            self._source.add(id, person.embedding_array)
+            self._source_names[id] = person.name
+            self._changed()
+
+    def remove(self, id: str):
+        index, names = self._store
+        index.remove(id)
+        names.pop(id, None)
+        if self._source is not None:
+            self.index.remove(id)
+            self._changed()
+
+    def _changed(self):
+        """Writer: publish a new snapshot soon, coalescing bursts of changes"""
+        if self._source is None:
+            return
+        self._dirty = True
+        if self._publish_task is None or self._publish_task.done():
+            self._publish_task = asyncio.create_task(self._publish_soon())
+
+    async def _publish_soon(self):
+        while self._dirty:
+            await asyncio.sleep(1.0)
+            self._dirty = False
+            await self._publish()
+
+    async def _publish(self):
+        ids, matrix = self._source.export()
+        names = [self._source_names.get(id, "") for id in ids]
+        await asyncio.to_thread(write_snapshot, self.index.directory, ids, names, matrix)
+        self.index.refresh(force=True)
+        print(f"✅ Shared gallery snapshot published ({len(ids)} embeddings)")
+
+    async def load(self, collection):
+        """Build the index from every Person that has an embedding"""
+        ids, names, embeddings = [], {}, []
+        cursor = collection.find({"embedding": {"$ne": None}}, GALLERY_PROJECTION)
+        async for doc in cursor.batch_size(5000):
+            entry = PersonEmbedding.model_validate(doc)
+            id = str(entry.id)
+            ids.append(id)
+            names[id] = entry.name
+            embeddings.append(entry.embedding_array)
+
+        matrix = np.array(embeddings, dtype=np.float32)
+        index, store_names = self._store
+        if isinstance(index, IVFIndex):
+            # Reuse persisted centroids; only train when there are none yet
+            index.build(ids, matrix, retrain=False)
+            await asyncio.to_thread(index.save, FACE_INDEX_PATH)
+        else:
+            index.build(ids, matrix)
+        store_names.clear()
+        store_names.update(names)
+        print(f"✅ Face gallery loaded ({len(index)} embeddings)")
+        if self._source is not None:
+            await self._publish()
+
+    async def start(self, collection):
+        self._collection = collection
+        if self.shared and not acquire_writer_lock(self.index.directory):
+            # Another worker loads the database; follow its snapshots and
+            # take over if it goes away
+            self.index.refresh(force=True)
+            print(f"✅ Face gallery mapped from {self.index.directory} ({len(self.index)} embeddings)")
+            self._task = asyncio.create_task(self._follow())
+            return
+        await self._initial_load()
+        self._task = asyncio.create_task(self._watch())
+
+    async def _initial_load(self):
+        if self.shared:
+            self._source = FaceIndex(self.index.dim)
+        try:
+            await self.load(self._collection)
+        except Exception as e:
+            print(f"Database error while loading face gallery: {e}")
+
+    async def _follow(self):
+        while not acquire_writer_lock(self.index.directory):
+            await asyncio.sleep(self.poll_seconds)
+        print("✅ Took over as shared gallery writer")
+        await self._initial_load()
+        await self._watch()
+
+    async def stop(self):
+        for task in (self._task, self._publish_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._publish_task = None
+
+    async def _watch(self):
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+            {"$project": {"fullDocument.img": 0}},
+        ]
+        while True:
+            try:
+                async with self._collection.watch(pipeline, full_document="updateLookup") as stream:
+                    print("✅ Gallery cache following change stream")
+                    async for change in stream:
+                        if change["operationType"] == "delete":
+                            self.remove(str(change["documentKey"]["_id"]))
+                        elif change.get("fullDocument"):
+                            self.upsert(change["fullDocument"])
+            except OperationFailure as e:
+                # Change streams need a replica set; fall back to polling
+                print(f"Change streams unavailable ({e}), polling every {self.poll_seconds}s")
+                await self._poll()
+                return
+            except PyMongoError as e:
+                print(f"Gallery change stream error: {e}, reconnecting")
+                await asyncio.sleep(5)
+
+    async def _poll(self):
+        """Pick up inserts and deletions by diffing the ids in the collection"""
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                known = set(self._store[1])
+                current = {str(doc["_id"]) async for doc in
+                           self._collection.find({"embedding": {"$ne": None}}, {"_id": 1})}
+                # ObjectIds from different clients are not ordered, so no `_id > latest`
+                added = [ObjectId(id) for id in current - known]
+                for start in range(0, len(added), 1000):
+                    query = {"_id": {"$in": added[start:start + 1000]}}
+                    async for doc in self._collection.find(query, GALLERY_PROJECTION):
+                        self.upsert(doc)
+                for id in known - current:
+                    self.remove(id)
+            except PyMongoError as e:
+                print(f"Gallery poll error: {e}")
+
+gallery = GalleryCache(create_face_index(), poll_seconds=GALLERY_POLL_SECONDS)
+
+# Every enrolled embedding, for 1:N identification
+face_index = gallery.index
+person_names = gallery.names
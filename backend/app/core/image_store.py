@@ -0,0 +1,83 @@
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional
+
+import cv2
+
+from app.core.config import IMAGE_STORE_DIR, THUMBNAIL_DIR, THUMBNAIL_SIZE
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def sniff_media_type(head: bytes) -> str:
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageStore:
+    """
+    Local content-addressed file store: images are saved under their SHA-256
+    digest, so identical uploads are stored once and a digest doubles as an ETag.
+    """
+
+    def __init__(self, root: str, thumbnail_root: str, thumbnail_size: int = 256):
+        self.root = root
+        self.thumbnail_root = thumbnail_root
+        self.thumbnail_size = thumbnail_size
+
+    def path(self, digest: str) -> str:
+        if not DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid image digest '{digest}'")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data: bytes, digest: Optional[str] = None) -> str:
+        """Store data; pass its SHA-256 digest when already known"""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return digest
+
+    def media_type(self, digest: str) -> str:
+        with open(self.path(digest), "rb") as f:
+            return sniff_media_type(f.read(12))
+
+    def thumbnail(self, digest: str) -> str:
+        """Path of a JPEG thumbnail, generated and cached on first use"""
+        path = os.path.join(self.thumbnail_root, f"{digest}_{self.thumbnail_size}.jpg")
+        if os.path.exists(path):
+            return path
+        img = cv2.imread(self.path(digest), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Stored image {digest} cannot be decoded")
+        height, width = img.shape[:2]
+        scale = self.thumbnail_size / max(height, width)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise ValueError(f"Cannot encode thumbnail for {digest}")
+        _write_atomic(path, encoded.tobytes())
+        return path
+
+
+image_store = ImageStore(IMAGE_STORE_DIR, THUMBNAIL_DIR, THUMBNAIL_SIZE)
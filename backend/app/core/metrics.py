@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+# Seconds; covers decode (~1 ms) up to a slow CPU detection pass
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labels + ("le",), key + (le,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Read at scrape time from a callback returning a number, or a
+    {label value: number} dict for a single-label gauge
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                 label: str = ""):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels((self.label,), (key,))} {float(v)}")
+        else:
+            lines.append(f"{self.name} {float(value)}")
+        return lines
+
+
+class RateMeter:
+    """Events per second over a sliding window of one-second buckets"""
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self._buckets: deque = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, n: int = 1):
+        second = int(time.monotonic())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += n
+            else:
+                self._buckets.append([second, n])
+            while self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+
+    def rate(self) -> float:
+        now = int(time.monotonic())
+        with self._lock:
+            total = sum(n for second, n in self._buckets if second > now - self.window)
+        return total / self.window
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn, label: str = "") -> Gauge:
+        return self.register(Gauge(name, help, fn, label))
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "face_stage_seconds", "Time spent per pipeline stage of a WebSocket frame", ["stage"])
+frames_total = metrics.counter(
+    "face_frames_total", "WebSocket frames by outcome", ["outcome"])
+errors_total = metrics.counter(
+    "face_errors_total", "Frame processing failures by stage", ["stage"])
+frame_rate = RateMeter()
+metrics.gauge("face_frames_per_second", "Frames processed per second (10 s window)",
+              frame_rate.rate)
@@ -0,0 +1,74 @@
+"""
+Convert stored Person.embedding values to packed binary.
+
+Legacy documents hold 512 BSON doubles; this rewrites them (and any packed
+embedding in a different codec) using EMBEDDING_CODEC or --codec. Run from
+backend/:
+
+    python -m app.core.migrate_embeddings --codec float16
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from app.core.config import MONGO_URI, EMBEDDING_CODEC
+from app.models.codec import CODECS, HEADER, decode_embedding, encode_embedding
+
+
+def needs_migration(value, codec: str) -> bool:
+    if isinstance(value, list):
+        return True
+    if isinstance(value, (bytes, bytearray)):
+        tag, _ = HEADER.unpack_from(value)
+        return tag != CODECS[codec]
+    return False
+
+
+async def migrate(codec: str, batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(MONGO_URI)
+    collection = client.get_default_database()["Person"]
+
+    scanned = converted = 0
+    bytes_before = bytes_after = 0
+    ops = []
+    cursor = collection.find({"embedding": {"$ne": None}}, {"embedding": 1})
+    async for doc in cursor:
+        scanned += 1
+        value = doc["embedding"]
+        if not needs_migration(value, codec):
+            continue
+        vector = value if isinstance(value, list) else decode_embedding(value)
+        packed = encode_embedding(vector, codec)
+        # A BSON double is 8 bytes (+ key overhead, ignored here)
+        bytes_before += len(value) * 8 if isinstance(value, list) else len(value)
+        bytes_after += len(packed)
+        converted += 1
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": packed}}))
+        if len(ops) >= batch_size:
+            if not dry_run:
+                await collection.bulk_write(ops, ordered=False)
+            ops = []
+            print(f"🔄 {converted} converted / {scanned} scanned")
+
+    if ops and not dry_run:
+        await collection.bulk_write(ops, ordered=False)
+
+    ratio = bytes_before / bytes_after if bytes_after else 0
+    action = "Would convert" if dry_run else "Converted"
+    print(f"✅ {action} {converted} of {scanned} embeddings to {codec} "
+          f"({bytes_before / 1e6:.1f} MB -> {bytes_after / 1e6:.1f} MB, {ratio:.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack Person embeddings as binary")
+    parser.add_argument("--codec", default=EMBEDDING_CODEC, choices=list(CODECS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.codec, args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from app.core.config import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_SLOW_FRAME_MS
+
+
+class SlowFrameProfiler:
+    """
+    Opt-in sampling profiler for slow frames.
+    A background thread samples the stacks of the inference threads every
+    interval and keeps the last few seconds; when a frame takes longer than
+    threshold_ms the samples taken while it ran are appended, in collapsed
+    ("folded") stack format, to a file that flamegraph tools read directly.
+    """
+
+    def __init__(self, threshold_ms: float, out_dir: str, interval_ms: float = 5,
+                 thread_prefixes=("inference", "embedding-batcher"), history_seconds: float = 10):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.path = os.path.join(out_dir, "slow_frames.folded")
+        self.reports = 0
+        self._samples: deque = deque(maxlen=int(history_seconds / self.interval))
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _collapse(self, frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        while True:
+            now = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if names.get(ident, "").startswith(self.thread_prefixes):
+                    self._samples.append((now, self._collapse(frame)))
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-frame-profiler", daemon=True)
+            self._thread.start()
+
+    def frame_done(self, start: float, end: float, label: str = ""):
+        """Call with perf_counter() bounds of a frame; writes a report if it was slow"""
+        elapsed_ms = (end - start) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        stacks = Counter(stack for t, stack in list(self._samples) if start <= t <= end)
+        if not stacks:
+            return
+        self.reports += 1
+        with open(self.path, "a") as f:
+            f.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')} {label} {elapsed_ms:.0f} ms\n")
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"🐢 Slow frame ({elapsed_ms:.0f} ms) profiled to {self.path}")
+
+
+slow_frame_profiler = SlowFrameProfiler(
+    PROFILE_SLOW_FRAME_MS, PROFILE_DIR, PROFILE_INTERVAL_MS) if PROFILE_SLOW_FRAME_MS > 0 else None
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Optional
+
+
+class LatestFrameMailbox:
+    """
+    Single-slot mailbox between a session's receiver and processor tasks.
+    put() overwrites any frame still waiting, so a slow processor always picks
+    up the newest frame and stale ones are dropped instead of queued.
+    """
+
+    def __init__(self):
+        self._item: Any = None
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def put(self, item: Any) -> bool:
+        """Returns True when an unprocessed frame was overwritten"""
+        self.received += 1
+        replaced = self._item is not None
+        if replaced:
+            self.dropped += 1
+        self._item = item
+        self._ready.set()
+        return replaced
+
+    async def get(self) -> Optional[Any]:
+        """Wait for the next frame; returns None once the mailbox is closed"""
+        await self._ready.wait()
+        self._ready.clear()
+        item, self._item = self._item, None
+        return item
+
+    def close(self):
+        self.closed = True
+        self._item = None
+        self._ready.set()
+
+    def stats(self) -> dict:
+        return {"received": self.received, "processed": self.processed, "dropped": self.dropped}
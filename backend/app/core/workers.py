@@ -0,0 +1,24 @@
+import os
+from typing import List
+
+import cv2
+from threadpoolctl import threadpool_limits
+
+from ml.registry import registry
+
+
+def pin_worker(slot: int, workers: int) -> List[int]:
+    """
+    Restrict this process to its share of the CPUs and size every thread
+    pool (ONNX Runtime, OpenCV, BLAS) to match, so N workers on N cores do
+    not oversubscribe. Call before any model is loaded.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cpus) // workers)
+    start = (slot * per_worker) % len(cpus)
+    mine = cpus[start:start + per_worker]
+    os.sched_setaffinity(0, mine)
+    cv2.setNumThreads(len(mine))
+    threadpool_limits(len(mine))
+    registry.threads = len(mine)
+    return mine
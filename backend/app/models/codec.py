@@ -0,0 +1,44 @@
+import struct
+from typing import Optional
+
+import numpy as np
+
+# Packed embedding layout: 8-byte header, then the vector.
+#   uint8 codec tag, 3 pad bytes, float32 scale (int8 only)
+# The header keeps the payload 4-byte aligned so float32 decodes zero-copy.
+HEADER = struct.Struct("<B3xf")
+
+CODECS = {"float32": 1, "float16": 2, "int8": 3}
+DTYPES = {1: np.float32, 2: np.float16, 3: np.int8}
+
+
+def encode_embedding(embedding, codec: str = "float32") -> bytes:
+    """Pack a vector as float32, float16 or symmetric int8 bytes"""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown embedding codec '{codec}', expected one of {list(CODECS)}")
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    scale = 1.0
+    if codec == "int8":
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        vector = np.clip(np.rint(vector / scale), -127, 127)
+    tag = CODECS[codec]
+    return HEADER.pack(tag, scale) + vector.astype(DTYPES[tag]).tobytes()
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """Unpack to a float32 vector; float32 payloads are returned without copying"""
+    tag, scale = HEADER.unpack_from(data)
+    if tag not in DTYPES:
+        raise ValueError(f"Unknown embedding codec tag {tag}")
+    vector = np.frombuffer(data, dtype=DTYPES[tag], offset=HEADER.size)
+    if tag == CODECS["int8"]:
+        return vector.astype(np.float32) * np.float32(scale)
+    return vector.astype(np.float32, copy=False)
+
+
+def coerce_embedding(value, codec: str = "float32") -> Optional[bytes]:
+    """Accept packed bytes or a legacy List[float] and return packed bytes"""
+    if value is None or isinstance(value, (bytes, bytearray)):
+        return bytes(value) if isinstance(value, bytearray) else value
+    return encode_embedding(value, codec)
@@ -1,17 +1,73 @@
-from beanie import Document
+from beanie import Document, PydanticObjectId
+from pydantic import BaseModel, Field, field_serializer, field_validator
 from bson import ObjectId
-from typing import List  # <- correct import for List
 
 from typing import Optional
 
+import numpy as np
 
-class Person(Document):
+from app.core.config import EMBEDDING_CODEC
+from app.models.codec import coerce_embedding, decode_embedding
+
+
+class PackedEmbedding:
+    """
+    Stores embedding as packed bytes (BSON Binary) instead of 512 doubles.
+    Legacy List[float] values are packed on load; JSON output is still a list.
+    """
+
+    @field_validator("embedding", mode="before", check_fields=False)
+    @classmethod
+    def _pack_embedding(cls, value):
+        return coerce_embedding(value, EMBEDDING_CODEC)
+
+    @field_serializer("embedding", when_used="json", check_fields=False)
+    def _unpack_embedding(self, value: Optional[bytes]):
+        return None if value is None else decode_embedding(value).tolist()
+
+    @property
+    def embedding_array(self) -> Optional[np.ndarray]:
+        return None if self.embedding is None else decode_embedding(self.embedding)
+
+
+class Person(PackedEmbedding, Document):
     _id: Optional[ObjectId] = None
-    img: str
+    # Legacy inline base64 photo; new records keep the photo in the image store
+    img: Optional[str] = None
+    img_id: Optional[str] = None
     name: str
     age: str
     last_seen_data: str
     phone_number: str
     last_seen_location: str
     add_info: str
-    embedding: Optional[List[float]] = None
+    embedding: Optional[bytes] = None
+
+    class Settings:
+        # Duplicate photo lookups on enrollment
+        indexes = ["img_id"]
+
+
+class PersonSummary(BaseModel):
+    """Projection for list/lookup responses: no photo bytes, no embedding"""
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    age: str
+    last_seen_data: str
+    phone_number: str
+    last_seen_location: str
+    add_info: str
+    img_id: Optional[str] = None
+
+
+class PersonImage(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    img: Optional[str] = None
+    img_id: Optional[str] = None
+
+
+class PersonEmbedding(PackedEmbedding, BaseModel):
+    """Projection used to load the face gallery without images"""
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    embedding: Optional[bytes] = None
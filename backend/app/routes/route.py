@@ -1,284 +1,533 @@
-from app.schemas.schema import PersonCreate
-from fastapi import APIRouter
-from app.models.model import Person
+from app.schemas.schema import PersonCreate, StreamCreate
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from beanie import PydanticObjectId
+from app.models.model import Person, PersonEmbedding, PersonImage, PersonSummary
+from app.models.codec import encode_embedding
 from bson import ObjectId
 import numpy as np
 import base64
-import cv2
-from typing import Dict
-from models.arcface.index import ArcFaceModel
-from ml.recognition import cosine_similarity
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+import asyncio
+import json
+import time
+import uuid
+from ml.alert_system import alerts
+from ml.embedding_cache import embedding_cache
+from ml.batcher import EmbeddingBatcher
+from ml.detection import DetSize, DetectionStage, FaceDetections, make_det_size
+from ml.ingest import IngestionService, StreamConfig, check_source
+from ml.frames import (
+    decode_binary_faces,
+    decode_binary_frame,
+    decode_data_url,
+    decode_json_faces,
+    parse_frame_header,
+)
+from ml.motion import MotionGate
+from ml.registry import registry
+from ml.face_index import normalize
+from ml.recognition import confidence_levels, get_confidence_level
+from ml.tracking import FaceTracker
+from app.core.config import (
+    FACE_DETECTOR,
+    INFERENCE_QUEUE_TIMEOUT,
+    EMBED_BATCH_WINDOW_MS,
+    EMBED_MAX_BATCH,
+    MATCH_THRESHOLD,
+    TRACK_RECHECK_FRAMES,
+    TRACK_IOU_THRESHOLD,
+    STREAM_WORKERS,
+    STREAM_SCHEMES,
+    STREAM_HOSTS,
+    STREAM_ALLOW_LOCAL,
+    MOTION_GATE,
+    MOTION_MIN_AREA,
+    MOTION_MAX_SKIP,
+    EMBEDDING_CODEC,
+    INFERENCE_WORKERS,
+    BULK_INSERT_BATCH,
+    MODEL_LOAD,
+    DET_SIZE,
+    DET_SIZE_MODE,
+    DET_SIZES,
+    DET_MIN_FACE_PX,
+)
+from app.core.gallery import gallery, face_index, person_names
+from app.core.enrollment import EnrollmentError, detect_upload, enroll_record, insert_people
+from app.core.executor import inference_executor, InferenceBusy
+from app.core.image_store import image_store
+from app.core.session import LatestFrameMailbox
+from app.core.metrics import metrics, stage_seconds, frames_total, errors_total, frame_rate
+from app.core.profiler import slow_frame_profiler
 from fastapi import HTTPException
 from fastapi import WebSocket, WebSocketDisconnect
-from mtcnn import MTCNN
-import cv2
 router = APIRouter()
 
-arcface = ArcFaceModel(ctx_id=0)
-detector = MTCNN()
-active_connections = {}
+registry.register("batcher", lambda: EmbeddingBatcher(
+    registry.get("arcface").rec_model, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH))
+# Models this app needs; nothing is loaded until warm-up or the first request
+MODELS = ["arcface"] + (["mtcnn"] if FACE_DETECTOR == "mtcnn" else []) + \
+    (["batcher"] if EMBED_BATCH_WINDOW_MS > 0 else [])
+detection = DetectionStage(detector=FACE_DETECTOR,
+                           batcher=registry.lazy("batcher") if EMBED_BATCH_WINDOW_MS > 0 else None,
+                           det_size=DET_SIZE)
+ingestion = IngestionService(detection, face_index, workers=STREAM_WORKERS,
+                             threshold=MATCH_THRESHOLD,
+                             det_size="adaptive" if DET_SIZE_MODE == "adaptive" else None)
+
+
+def _person_out(person: PersonSummary, request: Request, thumbnail: bool = False) -> dict:
+    """Person fields plus a URL for the photo instead of the photo itself"""
+    data = person.model_dump(exclude={"id", "img_id"})
+    data["_id"] = str(person.id)
+    url = request.url_for("get_person_image", id=str(person.id))
+    data["img"] = str(url.include_query_params(thumbnail=1) if thumbnail else url)
+    return data
 
 
 @router.post("/person")
-async def add_person(person: PersonCreate):
+async def add_person(person: PersonCreate, request: Request):
     try:
-        img_data = base64.b64decode(person.img.split(",")[-1])
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("Decoded image is None")
+        img_data, digest, detections = await inference_executor.run(
+            detect_upload, detection, person.img, person.landmarks, person.aligned,
+            timeout=INFERENCE_QUEUE_TIMEOUT)
+    except InferenceBusy:
+        raise HTTPException(
+            status_code=503, detail="Server is busy, try again later")
+    except EnrollmentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
 
-    embedding = arcface.get_embedding_from_frame(img)
-    if embedding is None:
+    if len(detections) == 0:
         raise HTTPException(
             status_code=400, detail="No face detected in image")
 
-    embedding_list = embedding.tolist()
-
-    new_person_data = person.dict()
-    new_person_data["embedding"] = embedding_list
+    # Same photo already enrolled: still added, but flagged for review
+    duplicates = [str(p.id) for p in await Person.find(Person.img_id == digest)
+                  .project(PersonSummary).to_list()]
+    if duplicates:
+        print(f"⚠️ Photo already enrolled for {', '.join(duplicates)}")
+
+    new_person_data = person.dict(exclude={"landmarks", "aligned"})
+    new_person_data["img"] = None
+    new_person_data["img_id"] = await asyncio.to_thread(image_store.put, img_data, digest)
+    new_person_data["embedding"] = encode_embedding(
+        detections.embeddings[detections.largest()], EMBEDDING_CODEC)
     new_person = Person(**new_person_data)
     await new_person.insert()
+    gallery.add_person(new_person)
 
-    return {"status": "success", "person": new_person}
+    summary = PersonSummary.model_validate(new_person.model_dump(by_alias=True))
+    return {"status": "success", "person": _person_out(summary, request), "duplicates": duplicates}
 
 
-@router.get("/person/{id}")
-async def get_person(id: str):
-    try:
-        object_id = ObjectId(id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid Person ID format")
+async def _ndjson_records(request: Request) -> AsyncIterator[Tuple[str, Any, Optional[bytes]]]:
+    """
+    One record per line of a streamed NDJSON body, photo as base64 img.
+    A malformed line is yielded as an EnrollmentError in place of the record.
+    """
+    buffer = bytearray()
+    index = 0
 
-    item = await Person.find_one({"_id": object_id})
-    if item:
-        return item
+    def parse(line: bytes):
+        nonlocal index
+        key = str(index)
+        index += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return key, EnrollmentError(f"Invalid JSON on line {index}: {e}"), None
+        if not isinstance(record, dict):
+            return key, EnrollmentError(f"Line {index} is not a JSON object"), None
+        return str(record.get("key", key)), record, None
+
+    async for chunk in request.stream():
+        # Only the new bytes are searched; base64 lines can be megabytes long
+        scan = len(buffer)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", scan)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            if line.strip():
+                yield parse(line)
+            start = scan = end + 1
+        del buffer[:start]
+    if buffer.strip():
+        yield parse(bytes(buffer))
+
+
+async def _multipart_records(request: Request) -> AsyncIterator[Tuple[str, dict, Optional[bytes]]]:
+    """
+    Image parts plus an optional `manifest` part (JSON list or NDJSON of
+    records whose `file` names an image part). Without a manifest each
+    image is one person named after its file.
+    """
+    form = await request.form()
+    files = {f.filename: f for f in form.getlist("files") if hasattr(f, "filename")}
+    manifest = form.get("manifest")
+    if manifest is None:
+        records = [{"name": name.rsplit(".", 1)[0].replace("_", " "), "file": name}
+                   for name in files]
     else:
-        raise HTTPException(status_code=404, detail="Person not found")
-
-active_connections: Dict[str, WebSocket] = {}
+        text = manifest if isinstance(manifest, str) else (await manifest.read()).decode()
+        text = text.strip()
+        records = json.loads(text) if text.startswith("[") else [
+            json.loads(line) for line in text.splitlines() if line.strip()]
+
+    for index, record in enumerate(records):
+        key = str(record.get("key", record.get("file", index)))
+        upload = files.get(record.get("file"))
+        yield key, record, (await upload.read()) if upload is not None else None
+
+
+@router.post("/people/bulk")
+async def add_people_bulk(request: Request):
+    """
+    Enroll many people in one request (NDJSON body or multipart upload).
+    Photos are embedded concurrently on the inference pool and inserted
+    BULK_INSERT_BATCH at a time; a bad record is reported by key without
+    failing the rest, so a client can resubmit just the failed keys.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        records = _multipart_records(request)
+    else:
+        records = _ndjson_records(request)
 
+    inserted, errors, ready = [], [], []
+    window = asyncio.Semaphore(INFERENCE_WORKERS * 2)
+    tasks = set()
 
-#     await websocket.accept()
-
-#     try:
-#         object_id = ObjectId(id)
-#         person = await Person.find_one({"_id": object_id})
-#         if not person or not person.embedding:
-#             await websocket.send_json({"error": "Person not found or has no embedding"})
-#             await websocket.close(code=1000, reason="Person not found or has no embedding")
-#             return
-
-#         embedding_array = np.array(person.embedding)
-#     except Exception:
-#         await websocket.send_json({"error": "Invalid Person ID"})
-#         await websocket.close()
-#         return
-
-#     active_connections[id] = websocket
-#     try:
-#         while True:
-#             try:
-#                 data = await websocket.receive_json()
-#             except WebSocketDisconnect:
-#                 raise
-#             except Exception as e:
-
-#                 try:
-#                     await websocket.send_json({"error": f"receive error: {e}"})
-#                 except Exception:
-#                     pass
-#                 continue
-
-#             img_b64 = data.get("frame")
-#             if not img_b64:
-#                 continue
-
-#             try:
-#                 img_data = base64.b64decode(img_b64.split(",")[-1])
-#                 np_arr = np.frombuffer(img_data, np.uint8)
-#                 img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-#                 if img is None:
-#                     continue
-#             except Exception as e:
-#                 try:
-#                     await websocket.send_json({"error": f"decode error: {e}"})
-#                 except Exception:
-#                     pass
-#                 continue
-
-#             try:
-#                 # detector = MTCNN()
-#                 # results = detector.detect_faces(img)
-#                 # if not results:
-#                 #     return None, None
-
-#                 # x, y, w, h = results[0]['box']
-#                 # bbox = [x, y, x+w, y+h]
-
-#                 # face_img = img[y:y+h, x:x+w]
-
-#                 face_embedding = arcface.get_embedding_from_frame(img)
-
-#                 if face_embedding is not None:
-#                     sim = cosine_similarity(embedding_array, face_embedding)
-#                     matched = sim > 0.4
-#                     print(matched, 'matched')
-
-#                     await websocket.send_json({
-#                         "matched": bool(matched),
-#                         # "bbox": bbox,
-#                         "similarity": float(sim),
-#                         "name": person.name if bool(matched) else None
-#                     })
-#                 else:
-#                     await websocket.send_json({"matched": False})
-#             except Exception as e:
-#                 try:
-#                     await websocket.send_json({"error": f"processing error: {e}"})
-#                 except Exception:
-#                     pass
-#                 continue
-
-#     except WebSocketDisconnect:
-#         active_connections.pop(id, None)
-#     except Exception as e:
-
-#         try:
-#             await websocket.send_json({"error": f"internal error: {e}"})
-#             await websocket.close(code=1011)
-#         except Exception:
-#             pass
+    async def flush():
+        batch = ready[:]
+        ready.clear()
+        try:
+            people = await insert_people(doc for _, doc in batch)
+        except Exception as e:
+            errors.extend({"key": key, "error": f"insert failed: {e}"} for key, _ in batch)
+            return
+        for (key, _), person in zip(batch, people):
+            gallery.add_person(person)
+            inserted.append({"key": key, "_id": str(person.id)})
 
+    async def enroll(key: str, record: dict, img_data: Optional[bytes]):
+        try:
+            doc = await inference_executor.run(
+                enroll_record, detection, record, img_data, timeout=INFERENCE_QUEUE_TIMEOUT)
+            ready.append((key, doc))
+        except InferenceBusy:
+            errors.append({"key": key, "error": "Server is busy, try again later"})
+        except Exception as e:
+            errors.append({"key": key, "error": str(e)})
+        finally:
+            window.release()
 
-@router.post("/person")
-async def add_person(person: PersonCreate):
     try:
-        img_data = base64.b64decode(person.img.split(",")[-1])
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("Decoded image is None")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
-
-    embedding = arcface.get_embedding_from_frame(img)
-    if embedding is None:
-        raise HTTPException(
-            status_code=400, detail="No face detected in image")
-
-    embedding_list = embedding.tolist()
-
-    new_person_data = person.dict()
-    new_person_data["embedding"] = embedding_list
-    new_person = Person(**new_person_data)
-    await new_person.insert()
-
-    return {"status": "success", "person": new_person}
+        async for key, record, img_data in records:
+            if isinstance(record, Exception):
+                errors.append({"key": key, "error": str(record)})
+                continue
+            await window.acquire()
+            task = asyncio.create_task(enroll(key, record, img_data))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if len(ready) >= BULK_INSERT_BATCH:
+                await flush()
+    except (ValueError, AttributeError) as e:
+        # Commit what was already embedded and say so, so the client can resume
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if ready:
+            await flush()
+        return JSONResponse({"status": "error", "detail": f"Invalid bulk payload: {e}",
+                             "inserted": inserted, "errors": errors}, status_code=400)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if ready:
+        await flush()
+
+    return {"status": "success", "inserted": inserted, "errors": errors}
 
 
 @router.get("/person/{id}")
-async def get_person(id: str):
+async def get_person(id: str, request: Request):
     try:
         object_id = ObjectId(id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid Person ID format")
 
-    item = await Person.find_one({"_id": object_id})
+    item = await Person.find_one({"_id": object_id}).project(PersonSummary)
     if item:
-        return item
+        return _person_out(item, request)
     else:
         raise HTTPException(status_code=404, detail="Person not found")
 
-active_connections: Dict[str, WebSocket] = {}
 
+async def _image_digest(object_id: ObjectId) -> str:
+    """Digest of a person's photo, moving a legacy inline photo into the store"""
+    item = await Person.find_one({"_id": object_id}).project(PersonImage)
+    if not item:
+        raise HTTPException(status_code=404, detail="Person not found")
+    if item.img_id:
+        return item.img_id
+    if not item.img:
+        raise HTTPException(status_code=404, detail="Person has no image")
 
-@router.websocket("/ws/{id}")
-async def start_detection(websocket: WebSocket, id: str):
-    await websocket.accept()
+    img_data = base64.b64decode(item.img.split(",")[-1])
+    digest = await asyncio.to_thread(image_store.put, img_data)
+    await Person.find_one({"_id": object_id}).update(
+        {"$set": {"img_id": digest}, "$unset": {"img": ""}})
+    return digest
 
+
+@router.get("/person/{id}/image")
+async def get_person_image(id: str, request: Request, thumbnail: bool = False):
     try:
         object_id = ObjectId(id)
-        person = await Person.find_one({"_id": object_id})
-        if not person or not person.embedding:
-            await websocket.send_json({"error": "Person not found or has no embedding"})
-            await websocket.close(code=1000, reason="Person not found or has no embedding")
-            return
-
-        embedding_array = np.array(person.embedding)
     except Exception:
-        await websocket.send_json({"error": "Invalid Person ID"})
-        await websocket.close()
-        return
+        raise HTTPException(status_code=400, detail="Invalid Person ID format")
+
+    digest = await _image_digest(object_id)
+    etag = f'"{digest}{"-thumb" if thumbnail else ""}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
 
-    active_connections[id] = websocket
     try:
-        while True:
-            try:
-                data = await websocket.receive_json()
-            except WebSocketDisconnect:
-                raise
-            except Exception as e:
-
-                try:
-                    await websocket.send_json({"error": f"receive error: {e}"})
-                except Exception:
-                    pass
-                continue
+        if thumbnail:
+            path = await inference_executor.run(
+                image_store.thumbnail, digest, timeout=INFERENCE_QUEUE_TIMEOUT)
+            media_type = "image/jpeg"
+        else:
+            path = image_store.path(digest)
+            media_type = await asyncio.to_thread(image_store.media_type, digest)
+    except InferenceBusy:
+        raise HTTPException(
+            status_code=503, detail="Server is busy, try again later")
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+active_connections: Dict[str, WebSocket] = {}
+
+# What a session's frames carry (?input=): whole frames to run the detector
+# on, frames plus faces the client located itself, or aligned face crops
+INPUT_MODES = ("frame", "landmarks", "aligned")
 
-            img_b64 = data.get("frame")
-            if not img_b64:
-                continue
+
+async def _receive_frames(websocket: WebSocket, mailbox: LatestFrameMailbox, input_mode: str):
+    """Read messages as fast as they arrive and keep only the newest frame"""
+    while True:
+        try:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            header = None
+            if message.get("bytes") is not None:
+                # Binary protocol: fixed header + raw JPEG, decoded in place
+                payload = message["bytes"]
+                header = parse_frame_header(payload)
+                decode = decode_binary_faces if input_mode == "landmarks" else decode_binary_frame
+            else:
+                # Legacy JSON protocol with a base64 data URL
+                data = json.loads(message.get("text") or "{}")
+                if input_mode == "landmarks":
+                    payload = data if data.get("frame") else None
+                    decode = decode_json_faces
+                else:
+                    payload = data.get("frame")
+                    decode = decode_data_url
+        except WebSocketDisconnect:
+            raise
+        except Exception as e:
 
             try:
-                img_data = base64.b64decode(img_b64.split(",")[-1])
-                np_arr = np.frombuffer(img_data, np.uint8)
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-                if img is None:
-                    continue
-            except Exception as e:
-                try:
-                    await websocket.send_json({"error": f"decode error: {e}"})
-                except Exception:
-                    pass
-                continue
+                await websocket.send_json({"error": f"receive error: {e}"})
+            except Exception:
+                pass
+            continue
+
+        if payload and mailbox.put((decode, payload, header)):
+            frames_total.inc(outcome="dropped")
+
+
+async def _process_frames(websocket: WebSocket, mailbox: LatestFrameMailbox,
+                          match: Callable[[FaceDetections], dict], tracker: Optional[FaceTracker],
+                          gate: Optional[MotionGate], det_size: DetSize, input_mode: str):
+    """Run the newest frame through the detection stage and send match()'s result"""
+    last_result = {"matched": False}
+    while True:
+        frame = await mailbox.get()
+        if frame is None:
+            return
+        decode, payload, header = frame
+
+        try:
+            decode_start = time.perf_counter()
+            decoded = await inference_executor.run(decode, payload, timeout=0)
+            decode_ms = (time.perf_counter() - decode_start) * 1000
+        except InferenceBusy:
+            # Shed the frame rather than queueing it behind other sessions
+            mailbox.dropped += 1
+            frames_total.inc(outcome="busy")
+            await websocket.send_json({"matched": False, "busy": True, "frames": mailbox.stats()})
+            continue
+        except Exception as e:
+            errors_total.inc(stage="decode")
+            try:
+                await websocket.send_json({"error": f"decode error: {e}"})
+            except Exception:
+                pass
+            continue
 
+        try:
+            img, detections = await inference_executor.run(
+                _run_stage, decoded, input_mode, tracker, gate, det_size, timeout=0)
+            timings = {"decode_ms": decode_ms, **detections.timings}
+
+            if detections.skipped:
+                # Static scene: repeat the last answer without running detection
+                result = {**last_result, "motion": False}
+            elif len(detections) == 0:
+                result = {"matched": False}
+            else:
+                match_start = time.perf_counter()
+                result = match(detections)
+                timings["match_ms"] = (time.perf_counter() - match_start) * 1000
+
+                boxes = detections.boxes.astype(np.float32)
+                if header and header.width and header.height:
+                    # Report boxes in the client's coordinate space
+                    boxes *= np.array([header.width / img.shape[1], header.height / img.shape[0]] * 2,
+                                      dtype=np.float32)
+                boxes = boxes.astype(int).tolist()
+                for row, face in enumerate(result["faces"]):
+                    face["bbox"] = boxes[row]
+                    face["score"] = float(detections.scores[row])
+                    if detections.track_ids is not None:
+                        face["track_id"] = int(detections.track_ids[row])
+                # Top-level fields describe the best face, for single-face clients
+                result["bbox"] = boxes[result["best_face"]]
+            if not detections.skipped:
+                last_result = dict(result)
+
+            mailbox.processed += 1
+            if header:
+                result["seq"] = header.seq
+            result["timings"] = timings
+            result["det_size"] = detections.det_size
+            result["frames"] = mailbox.stats()
+            if gate is not None:
+                result["frames"]["skipped"] = gate.skipped
+                result["frames"]["skip_ratio"] = gate.skip_ratio
+            send_start = time.perf_counter()
+            await websocket.send_json(result)
+            timings["send_ms"] = (time.perf_counter() - send_start) * 1000
+            _record_frame(timings, decode_start, "skipped" if detections.skipped else "processed")
+        except InferenceBusy:
+            mailbox.dropped += 1
+            frames_total.inc(outcome="busy")
+            await websocket.send_json({"matched": False, "busy": True, "frames": mailbox.stats()})
+            continue
+        except Exception as e:
+            errors_total.inc(stage="process")
             try:
-                detector = MTCNN()
-                results = detector.detect_faces(img)
-                if not results:
-                    return None, None
+                await websocket.send_json({"error": f"processing error: {e}"})
+            except Exception:
+                pass
+            continue
+
+
+def _run_stage(decoded, input_mode: str, tracker: Optional[FaceTracker],
+               gate: Optional[MotionGate], det_size: DetSize) -> Tuple[np.ndarray, FaceDetections]:
+    """Detection stage call for one decoded message; returns the image and its faces"""
+    if input_mode == "landmarks":
+        img, boxes, landmarks = decoded
+        return img, detection.process_faces(img, landmarks, boxes, tracker)
+    if input_mode == "aligned":
+        return decoded, detection.process_aligned([decoded])
+    return decoded, detection.process(decoded, tracker, gate, det_size)
+
+
+def _record_frame(timings: Dict[str, float], start: float, outcome: str):
+    """Feed one frame's stage timings to the metrics and the slow-frame profiler"""
+    end = time.perf_counter()
+    for key, ms in timings.items():
+        stage_seconds.observe(ms / 1000, stage=key[:-3])
+    stage_seconds.observe(end - start, stage="total")
+    frames_total.inc(outcome=outcome)
+    frame_rate.tick()
+    if slow_frame_profiler is not None:
+        slow_frame_profiler.frame_done(start, end, label=outcome)
+
+
+async def _detection_loop(websocket: WebSocket, match: Callable[[FaceDetections], dict],
+                          tracker: Optional[FaceTracker]):
+    """
+    Receiver and processor run as separate tasks joined by a single-slot
+    mailbox, so latency stays bounded however slow inference is
+    """
+    mailbox = LatestFrameMailbox()
+    gate = MotionGate(min_motion=MOTION_MIN_AREA, max_skip=MOTION_MAX_SKIP) if MOTION_GATE else None
+    try:
+        det_size = _session_det_size(websocket.query_params.get("det_size"))
+    except ValueError as e:
+        await websocket.send_json({"error": str(e)})
+        det_size = _session_det_size(None)
+    input_mode = websocket.query_params.get("input") or "frame"
+    if input_mode not in INPUT_MODES:
+        await websocket.send_json({"error": f"Unknown input '{input_mode}', expected one of {INPUT_MODES}"})
+        input_mode = "frame"
+    processor = asyncio.create_task(
+        _process_frames(websocket, mailbox, match, tracker, gate, det_size, input_mode))
+    try:
+        await _receive_frames(websocket, mailbox, input_mode)
+    finally:
+        mailbox.close()
+        processor.cancel()
+        await asyncio.gather(processor, return_exceptions=True)
 
-                x, y, w, h = results[0]['box']
-                bbox = [x, y, x+w, y+h]
 
-                bbox = [int(x), int(y), int(x+w), int(y+h)]
+def _session_det_size(value: Optional[str]) -> DetSize:
+    """Detector input size for one session: ?det_size=, else DET_SIZE_MODE"""
+    if not value and DET_SIZE_MODE == "adaptive":
+        value = "adaptive"
+    return make_det_size(value, DET_SIZES, DET_MIN_FACE_PX)
 
-                face_embedding = arcface.get_embedding_from_frame(img)
 
-                if face_embedding is not None:
-                    sim = cosine_similarity(embedding_array, face_embedding)
-                    matched = sim > 0.4
+def _new_tracker() -> Optional[FaceTracker]:
+    if TRACK_RECHECK_FRAMES <= 0:
+        return None
+    return FaceTracker(iou_threshold=TRACK_IOU_THRESHOLD,
+                       recheck_interval=TRACK_RECHECK_FRAMES)
+
+
+def _smoothed(tracker: Optional[FaceTracker], detections: FaceDetections,
+              row: int, similarity: float, person_id: Optional[str] = None) -> float:
+    """Per-track similarity to person_id averaged over time when tracking is on"""
+    if tracker is None or detections.track_ids is None:
+        return similarity
+    return tracker.observe(int(detections.track_ids[row]), similarity, person_id)
 
-                    await websocket.send_json({
-                        "matched": bool(matched),
-                        "bbox": bbox,
-                        "similarity": float(sim),
-                        "name": person.name if bool(matched) else None
-                    })
-                else:
-                    await websocket.send_json({"matched": False,  "bbox": bbox, })
-            except Exception as e:
-                try:
-                    await websocket.send_json({"error": f"processing error: {e}"})
-                except Exception:
-                    pass
-                continue
 
+def _with_best_face(faces: list) -> dict:
+    """Per-face results plus the most similar face's fields at the top level"""
+    best = max(range(len(faces)), key=lambda row: faces[row].get("similarity", -1.0))
+    return {**faces[best], "best_face": best, "faces": faces}
+
+
+async def _run_session(websocket: WebSocket, key: str, match: Callable[[FaceDetections], dict],
+                       tracker: Optional[FaceTracker]):
+    active_connections[key] = websocket
+    try:
+        await _detection_loop(websocket, match, tracker)
     except WebSocketDisconnect:
-        active_connections.pop(id, None)
+        pass
     except Exception as e:
 
         try:
@@ -286,42 +535,177 @@ async def start_detection(websocket: WebSocket, id: str):
             await websocket.close(code=1011)
         except Exception:
             pass
+    finally:
+        active_connections.pop(key, None)
 
 
-@router.get("/people")
-async def list_persons():
-    persons = await Person.find_all().to_list()
-    return {"persons": persons}
+@router.websocket("/ws/identify")
+async def start_identification(websocket: WebSocket):
+    """Match every frame against the whole gallery instead of one person"""
+    await websocket.accept()
+    tracker = _new_tracker()
+
+    def match(detections: FaceDetections) -> dict:
+        # Every face in the frame is searched in one call
+        faces = []
+        for row, candidates in enumerate(face_index.search(detections.embeddings, k=5)):
+            if not candidates:
+                faces.append({"matched": False, "candidates": []})
+                continue
+            best_id, sim = candidates[0]
+            sim = _smoothed(tracker, detections, row, sim, best_id)
+            matched = sim > MATCH_THRESHOLD
+            faces.append({
+                "matched": matched,
+                "similarity": sim,
+                "confidence": get_confidence_level(sim),
+                "person_id": best_id if matched else None,
+                "name": person_names.get(best_id) if matched else None,
+                "candidates": [
+                    {"person_id": pid, "name": person_names.get(pid), "similarity": s}
+                    for pid, s in candidates
+                ],
+            })
+        return _with_best_face(faces)
+
+    await _run_session(websocket, f"identify-{uuid.uuid4()}", match, tracker)
 
 
-@router.get("/people")
-async def list_persons():
+@router.websocket("/ws/{id}")
+async def start_detection(websocket: WebSocket, id: str):
+    await websocket.accept()
+
     try:
-        persons = await Person.find_all().to_list()
-        return {"persons": persons}
-    except Exception as e:
+        object_id = ObjectId(id)
+        cached = gallery.get(id)
+        if cached is not None:
+            name, embedding_array = cached
+        else:
+            # Not in the warm cache yet (e.g. change stream lag): ask the database
+            person = await Person.find_one({"_id": object_id}).project(PersonEmbedding)
+            if person is None or person.embedding is None:
+                await websocket.send_json({"error": "Person not found or has no embedding"})
+                await websocket.close(code=1000, reason="Person not found or has no embedding")
+                return
+            name, embedding_array = person.name, person.embedding_array
+    except Exception:
+        await websocket.send_json({"error": "Invalid Person ID"})
+        await websocket.close()
+        return
 
-        print(f"Database error: {e}")
-        mock_persons = [
-            {
-                "_id": "507f1f77bcf86cd799439011",
-                "name": "Батбаяр",
-                "age": "25",
-                "last_seen_data": "2024-01-15",
-                "phone_number": "+976-99887766",
-                "last_seen_location": "Улаанбаатар хот",
-                "add_info": "Хар үстэй, өндөр биетэй",
-                "img": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQEAYABgAAD/2wBDAAEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/2wBDAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwA/wA="
-            },
-            {
-                "_id": "507f1f77bcf86cd799439012",
-                "name": "Сарангэрэл",
-                "age": "32",
-                "last_seen_data": "2024-01-10",
-                "phone_number": "+976-88776655",
-                "last_seen_location": "Дархан хот",
-                "add_info": "Урт үстэй, дунд биетэй",
-                "img": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQEAYABgAAD/2wBDAAEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/2wBDAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwA/wA="
-            }
+    tracker = _new_tracker()
+    target = normalize(embedding_array)[0]
+
+    def match(detections: FaceDetections) -> dict:
+        # Cosine similarity of every face against the target in one product
+        sims = normalize(detections.embeddings) @ target
+        sims = np.array([_smoothed(tracker, detections, row, float(sim))
+                         for row, sim in enumerate(sims)])
+        matched = sims > MATCH_THRESHOLD
+        faces = [
+            {"matched": bool(m), "similarity": float(sim), "confidence": str(level),
+             "name": name if m else None}
+            for m, sim, level in zip(matched, sims, confidence_levels(sims))
         ]
-        return {"persons": mock_persons}
+        return _with_best_face(faces)
+
+    await _run_session(websocket, id, match, tracker)
+
+
+metrics.gauge("face_active_sessions", "Open WebSocket detection sessions",
+              lambda: len(active_connections))
+metrics.gauge("face_inference_pending", "Jobs running or queued on the inference pool",
+              lambda: inference_executor.pending)
+metrics.gauge("face_embed_batch_queue", "Crop submissions waiting for a recognition batch",
+              lambda: registry.get("batcher").queued if registry.loaded("batcher") else 0)
+metrics.gauge("face_alert_queue", "Alerts waiting for delivery", lambda: alerts.stats()["queued"])
+metrics.gauge("face_gallery_size", "Embeddings in the face index", lambda: len(face_index))
+metrics.gauge("face_embedding_cache_lookups", "Embedding cache lookups by result",
+              lambda: {k: embedding_cache.stats()[k] for k in ("hits", "disk_hits", "misses")},
+              label="result")
+metrics.gauge("face_embedding_cache_bytes", "Bytes held by the in-memory embedding cache",
+              lambda: embedding_cache.bytes)
+metrics.gauge("face_stream_fps", "Frames processed per second by each ingestion stream",
+              lambda: {name: s["processed_fps"] for name, s in ingestion.stats().items()},
+              label="stream")
+metrics.gauge("face_stream_dropped", "Frames dropped by each live ingestion stream",
+              lambda: {name: s["frames_dropped"] for name, s in ingestion.stats().items()},
+              label="stream")
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of latency histograms, queue depths and rates"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/ready")
+async def readiness():
+    """503 until the models this app needs are loaded and warmed up"""
+    ready = MODEL_LOAD == "lazy" or registry.is_warm(MODELS)
+    body = {"ready": ready, "models": registry.status()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@router.get("/alerts")
+async def list_alerts(limit: int = Query(50, ge=1, le=1000), person_id: Optional[str] = None):
+    """Recent alerts and counts from the alert log"""
+    return {
+        "count": alerts.log.count(person_id),
+        "alerts": [a for a in alerts.log.recent(1000 if person_id else limit)
+                   if person_id is None or a["person_id"] == person_id][:limit],
+        "pipeline": alerts.stats(),
+    }
+
+
+@router.get("/embedding-cache")
+async def embedding_cache_stats():
+    """Hit/miss counts and size of the content-addressed embedding cache"""
+    return embedding_cache.stats()
+
+
+@router.get("/streams")
+async def list_streams():
+    return {"streams": ingestion.stats()}
+
+
+@router.post("/streams")
+async def add_stream(stream: StreamCreate):
+    try:
+        make_det_size(stream.det_size)
+        check_source(stream.source, STREAM_SCHEMES, STREAM_HOSTS, STREAM_ALLOW_LOCAL)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        ingestion.add_stream(StreamConfig(**stream.dict()))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "stream": stream}
+
+
+@router.delete("/streams/{name}")
+async def remove_stream(name: str):
+    # Joining the decode thread can block briefly
+    removed = await asyncio.to_thread(ingestion.remove_stream, name)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return {"status": "success"}
+
+
+@router.get("/people")
+async def list_persons(request: Request, limit: int = Query(50, ge=1, le=200),
+                       after: Optional[str] = None):
+    """One page of people ordered by id; pass the returned `next` as `after`"""
+    query = Person.find_all()
+    if after:
+        try:
+            query = Person.find(Person.id > PydanticObjectId(after))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    persons = await query.sort(+Person.id).limit(limit).project(PersonSummary).to_list()
+    next_cursor = str(persons[-1].id) if len(persons) == limit else None
+    return {
+        "persons": [_person_out(p, request, thumbnail=True) for p in persons],
+        "next": next_cursor,
+    }
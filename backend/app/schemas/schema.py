@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from bson import ObjectId
-from typing import List
+from typing import List, Union
 
 from typing import Optional
 
@@ -15,3 +15,16 @@ class PersonCreate(BaseModel):
     last_seen_location: str
     add_info: str
     embedding: Optional[List[float]] = None
+    # Skip detection: five [x, y] landmarks of the face in img, or img is
+    # already an aligned crop at the recognition input size (112x112)
+    landmarks: Optional[List[List[float]]] = None
+    aligned: bool = False
+
+
+class StreamCreate(BaseModel):
+    name: str
+    source: str
+    sample_fps: float = 5.0
+    enabled: bool = True
+    motion_gate: bool = True
+    det_size: Optional[Union[int, str]] = None
@@ -0,0 +1,81 @@
+"""
+Recall vs latency of the IVF face index against exact cosine search.
+
+Generates synthetic 512-d "identities" (a random centre per person plus
+per-photo noise), so queries behave like a new photo of an enrolled person.
+
+Run from backend/:
+    python -m benchmarks.ann_recall --size 200000 --nlist 1024 --nprobe 4 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ml.face_index import FaceIndex, normalize
+from ml.ivf_index import IVFIndex
+
+
+def synthetic_embeddings(size: int, dim: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((size, dim), dtype=np.float32))
+    gallery = normalize(centres + noise * rng.standard_normal((size, dim), dtype=np.float32) / np.sqrt(dim))
+    return centres, gallery
+
+
+def time_search(index, queries: np.ndarray, k: int, **kwargs):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k=k, **kwargs)[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def recall(approx, exact) -> float:
+    hits = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approx, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--noise", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    centres, gallery = synthetic_embeddings(args.size, args.dim, args.noise, args.seed)
+    ids = [str(i) for i in range(args.size)]
+    rng = np.random.default_rng(args.seed + 1)
+    picked = rng.choice(args.size, size=args.queries, replace=False)
+    queries = normalize(centres[picked] + args.noise * rng.standard_normal(
+        (args.queries, args.dim), dtype=np.float32) / np.sqrt(args.dim))
+
+    exact = FaceIndex(args.dim)
+    exact.build(ids, gallery)
+    exact_results, exact_ms = time_search(exact, queries, args.k)
+    top1 = np.mean([r[0][0] == str(p) for r, p in zip(exact_results, picked)])
+    print(f"exact      p50 {np.percentile(exact_ms, 50):7.2f} ms  "
+          f"p95 {np.percentile(exact_ms, 95):7.2f} ms  top-1 identity {top1:.3f}")
+
+    start = time.perf_counter()
+    ivf = IVFIndex(args.dim, nlist=args.nlist, seed=args.seed)
+    ivf.build(ids, gallery)
+    print(f"ivf build  {time.perf_counter() - start:.1f} s (nlist={args.nlist})")
+
+    for nprobe in args.nprobe:
+        results, ms = time_search(ivf, queries, args.k, nprobe=nprobe)
+        top1 = np.mean([bool(r) and r[0][0] == e[0][0] for r, e in zip(results, exact_results)])
+        print(f"nprobe {nprobe:3d} p50 {np.percentile(ms, 50):7.2f} ms  "
+              f"p95 {np.percentile(ms, 95):7.2f} ms  recall@1 {top1:.3f}  "
+              f"recall@{args.k} {recall(results, exact_results):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Detection throughput vs recall at different RetinaFace input sizes.
+
+Runs every image of a fixed set through the detector at each size and
+counts a face as found when it overlaps (IoU >= 0.5) a face found at the
+largest size. The adaptive policy is replayed over the images in name
+order, so point it at extracted video frames to mimic a stream.
+
+Run from backend/:
+    python -m benchmarks.det_size --images ./data/frames --sizes 320 480 640
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ml.detection import AdaptiveDetSize
+from ml.frames import load_images
+from ml.registry import registry
+from ml.tracking import iou_matrix
+
+
+def found(boxes: np.ndarray, reference: np.ndarray) -> int:
+    if len(boxes) == 0 or len(reference) == 0:
+        return 0
+    return int((iou_matrix(reference[:, :4], boxes[:, :4]).max(axis=1) >= 0.5).sum())
+
+
+def run(arcface, images, size: int):
+    boxes, latencies = [], []
+    for img in images:
+        start = time.perf_counter()
+        bboxes, _ = arcface.detect(img, size)
+        latencies.append((time.perf_counter() - start) * 1000)
+        boxes.append(bboxes)
+    return boxes, np.array(latencies)
+
+
+def report(label, boxes, latencies, reference):
+    total = sum(len(r) for r in reference)
+    hits = sum(found(b, r) for b, r in zip(boxes, reference))
+    print(f"{label:>9s}  {1000 / latencies.mean():6.1f} img/s  "
+          f"p50 {np.percentile(latencies, 50):6.1f} ms  p95 {np.percentile(latencies, 95):6.1f} ms  "
+          f"recall {hits / max(total, 1):.3f} ({hits}/{total})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector input size benchmark")
+    parser.add_argument("--images", required=True, help="directory of test images")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--min-face-px", type=int, default=48)
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    arcface = registry.get("arcface")
+    registry.warm_up(["arcface"])
+    sizes = sorted(args.sizes)
+
+    reference, _ = run(arcface, images, sizes[-1])
+    print(f"{len(images)} images, {sum(len(r) for r in reference)} faces at {sizes[-1]}")
+    for size in sizes:
+        boxes, latencies = run(arcface, images, size)
+        report(str(size), boxes, latencies, reference)
+
+    adaptive = AdaptiveDetSize(sizes, args.min_face_px)
+    boxes, latencies, used = [], [], []
+    for img in images:
+        size = adaptive.size()
+        start = time.perf_counter()
+        bboxes, _ = arcface.detect(img, size)
+        latencies.append((time.perf_counter() - start) * 1000)
+        adaptive.observe(bboxes, img.shape)
+        boxes.append(bboxes)
+        used.append(size)
+    report("adaptive", boxes, np.array(latencies), reference)
+    print("adaptive sizes used: " + ", ".join(
+        f"{s}: {used.count(s)}" for s in sizes))
+
+
+if __name__ == "__main__":
+    main()
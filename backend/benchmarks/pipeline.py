@@ -0,0 +1,305 @@
+"""
+Offline end-to-end benchmark of the detection/recognition pipeline.
+
+Needs no webcam and no MongoDB. A reproducible input set is generated
+from insightface's bundled sample photo (or --images): still images at a
+few resolutions plus a short panning video clip. Each scenario then runs
+in a fresh interpreter so peak RSS is measured per scenario:
+
+    arcface  ArcFaceModel.get_faces() on every image
+    ws       /api/ws/identify through the FastAPI test client, one binary
+             frame in flight at a time, against a synthetic gallery
+    video    ml.video_processing.run_video_detection() headless on the clip
+
+Results (throughput, p50/p95/p99 latency, peak RSS) are printed and
+written as JSON; pass an earlier file with --compare to see the change.
+
+Run from backend/:
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ml.frames import load_images
+
+SCENARIOS = ("arcface", "ws", "video")
+RESOLUTIONS = ((640, 480), (1280, 720), (1920, 1080))
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(latencies_ms, elapsed: float, **extra) -> dict:
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    if len(latencies) == 0:
+        return {"count": 0, "peak_rss_mb": peak_rss_mb(), **extra}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+def _source_photos(images_dir):
+    if images_dir:
+        return load_images(images_dir)
+    import insightface
+
+    return [insightface.data.get_image("t1")]
+
+
+def generate_inputs(out_dir: str, images_dir=None, count: int = 60,
+                    video_frames: int = 150, seed: int = 0) -> dict:
+    """
+    Deterministic test set: each image is a randomly scaled, flipped and
+    brightness-shifted source photo on a canvas of one of RESOLUTIONS, and
+    the clip pans and zooms across a source photo at 25 fps
+    """
+    rng = np.random.default_rng(seed)
+    photos = _source_photos(images_dir)
+    if not photos:
+        raise SystemExit(f"No images found in {images_dir}")
+    image_dir = os.path.join(out_dir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(image_dir, "*.jpg")):
+        os.remove(path)
+
+    for i in range(count):
+        width, height = RESOLUTIONS[i % len(RESOLUTIONS)]
+        photo = photos[i % len(photos)]
+        scale = rng.uniform(0.6, 1.0) * min(width / photo.shape[1], height / photo.shape[0])
+        face = cv2.resize(photo, None, fx=scale, fy=scale)
+        if rng.random() < 0.5:
+            face = cv2.flip(face, 1)
+        face = cv2.convertScaleAbs(face, alpha=1.0, beta=float(rng.uniform(-30, 30)))
+        canvas = np.full((height, width, 3), rng.integers(0, 255, 3), dtype=np.uint8)
+        y = int(rng.integers(0, height - face.shape[0] + 1))
+        x = int(rng.integers(0, width - face.shape[1] + 1))
+        canvas[y:y + face.shape[0], x:x + face.shape[1]] = face
+        cv2.imwrite(os.path.join(image_dir, f"{i:04d}.jpg"), canvas)
+
+    video_path = os.path.join(out_dir, "clip.mp4")
+    width, height = RESOLUTIONS[0]
+    photo = cv2.resize(photos[0], (width * 2, height * 2))
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+    for i in range(video_frames):
+        t = i / max(video_frames - 1, 1)
+        zoom = 1.0 + 0.5 * t
+        crop_w, crop_h = int(photo.shape[1] / zoom), int(photo.shape[0] / zoom)
+        x = int((photo.shape[1] - crop_w) * t)
+        y = int((photo.shape[0] - crop_h) * 0.5)
+        writer.write(cv2.resize(photo[y:y + crop_h, x:x + crop_w], (width, height)))
+    writer.release()
+    return {"images": count, "video_frames": video_frames, "seed": seed,
+            "source": images_dir or "insightface:t1"}
+
+
+def bench_arcface(data_dir: str, args) -> dict:
+    from ml.registry import registry
+
+    images = load_images(os.path.join(data_dir, "images"))
+    arcface = registry.get("arcface")
+    registry.warm_up(["arcface"])
+    for img in images[:args.warmup]:
+        arcface.get_faces(img)
+
+    latencies, faces = [], 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for img in images:
+            frame_start = time.perf_counter()
+            boxes, _, _ = arcface.get_faces(img)
+            faces += len(boxes)
+            latencies.append((time.perf_counter() - frame_start) * 1000)
+    return summarize(latencies, time.perf_counter() - start, faces=faces)
+
+
+def bench_ws(data_dir: str, args) -> dict:
+    from fastapi.testclient import TestClient
+
+    import main
+    from app.core.gallery import face_index
+    from app.routes.route import MODELS
+    from ml.frames import FRAME_HEADER
+    from ml.registry import registry
+
+    images = load_images(os.path.join(data_dir, "images"))
+    registry.warm_up(MODELS)
+    # Startup events (MongoDB, gallery load) are not run; fill the index directly
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.gallery_size):
+        face_index.add(f"bench-{i}", rng.standard_normal(512).astype(np.float32))
+
+    frames = []
+    for img in images:
+        ok, jpeg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append((img.shape[1], img.shape[0], jpeg.tobytes()))
+
+    client = TestClient(main.app)
+    latencies, busy, errors, seq = [], 0, 0, 0
+    with client.websocket_connect("/api/ws/identify") as websocket:
+        def send(width, height, jpeg):
+            nonlocal seq
+            seq += 1
+            websocket.send_bytes(FRAME_HEADER.pack(seq, time.time() * 1000, width, height) + jpeg)
+            return websocket.receive_json()
+
+        for frame in frames[:args.warmup]:
+            send(*frame)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for frame in frames:
+                frame_start = time.perf_counter()
+                result = send(*frame)
+                latencies.append((time.perf_counter() - frame_start) * 1000)
+                busy += bool(result.get("busy"))
+                errors += "error" in result
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed, busy=busy, errors=errors,
+                     gallery_size=len(face_index))
+
+
+def bench_video(data_dir: str, args) -> dict:
+    from ml.face_index import normalize
+    from ml.registry import registry
+    from ml.video_processing import run_video_detection
+
+    arcface = registry.get("arcface")
+    registry.warm_up(["arcface"])
+    # Target embedding: the first face of the first image
+    target = os.path.join(data_dir, "target.npy")
+    _, _, embeddings = arcface.get_faces(load_images(os.path.join(data_dir, "images"))[0])
+    embedding = embeddings[0] if len(embeddings) else np.ones(512, dtype=np.float32)
+    np.save(target, normalize(embedding)[0])
+
+    latencies, skipped = [], 0
+
+    def on_frame(detections, elapsed_ms):
+        nonlocal skipped
+        latencies.append(elapsed_ms)
+        skipped += bool(detections.skipped)
+
+    start = time.perf_counter()
+    run_video_detection(os.path.join(data_dir, "clip.mp4"), target, display=False,
+                        det_size=args.det_size, on_frame=on_frame)
+    return summarize(latencies, time.perf_counter() - start, motion_skipped=skipped)
+
+
+BENCHMARKS = {"arcface": bench_arcface, "ws": bench_ws, "video": bench_video}
+
+
+def run_scenario(name: str, args) -> dict:
+    """Run one scenario in a fresh interpreter; returns its summary"""
+    command = [sys.executable, "-m", "benchmarks.pipeline", "--scenario", name,
+               "--data", args.data, "--repeat", str(args.repeat), "--warmup", str(args.warmup),
+               "--gallery-size", str(args.gallery_size), "--seed", str(args.seed)]
+    if args.det_size:
+        command += ["--det-size", str(args.det_size)]
+    # ml.alert_system writes to ALERTS_DIR at import; keep benchmark alerts
+    # out of the real directory and away from any configured webhook
+    with tempfile.TemporaryDirectory(prefix="bench-alerts-") as alerts_dir:
+        env = {**os.environ, "ALERTS_DIR": alerts_dir, "ALERT_SINKS": "file"}
+        out = subprocess.run(command, capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        return {"error": (out.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_result(name: str, result: dict, previous=None):
+    if "error" in result:
+        print(f"{name:8s}  failed: {result['error']}")
+        return
+    line = (f"{name:8s}  {result['throughput']:7.1f}/s  p50 {result['p50_ms']:7.1f} ms  "
+            f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+            f"rss {result['peak_rss_mb']:6.0f} MB")
+    if previous and "error" not in previous:
+        line += (f"  ({(result['throughput'] / previous['throughput'] - 1) * 100:+.1f}% /s, "
+                 f"{(result['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}% p95)")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--images", default=None,
+                        help="source photos for the generated set (default: insightface sample)")
+    parser.add_argument("--data", default="./data/bench", help="where the generated set is written")
+    parser.add_argument("--count", type=int, default=60, help="generated images")
+    parser.add_argument("--video-frames", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed frames first")
+    parser.add_argument("--gallery-size", type=int, default=1000)
+    parser.add_argument("--det-size", default=None, help="detector input size or 'adaptive'")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON results path")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to diff against")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        # Child process: run one scenario and print its summary as the last line
+        print(json.dumps(BENCHMARKS[args.scenario](args.data, args)))
+        return
+
+    inputs = generate_inputs(args.data, args.images, args.count, args.video_frames, args.seed)
+    commit = git_commit()
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["scenarios"]
+        print(f"📊 Comparing against {args.compare}")
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args)
+        print_result(name, results[name], previous.get(name))
+
+    out = args.out or os.path.join("benchmarks", "results",
+                                   f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "inputs": inputs,
+            "params": {"repeat": args.repeat, "warmup": args.warmup,
+                       "gallery_size": args.gallery_size, "det_size": args.det_size},
+            "scenarios": results,
+        }, f, indent=2)
+    print(f"✅ Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
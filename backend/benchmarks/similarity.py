@@ -0,0 +1,72 @@
+"""
+Batched similarity (ml.recognition.match_batch) vs the per-pair functions.
+
+Times matching Q query faces against a gallery of G random embeddings with
+a Python loop over cosine_similarity/compare_faces and with one batched
+call over a FaceIndex and each reduced-precision EmbeddingMatrix, and checks
+the batched top-1 agrees with the loop.
+
+Run from backend/:
+    python -m benchmarks.similarity --gallery 1000 10000 --queries 1 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ml.face_index import FaceIndex
+from ml.recognition import (STORAGE_DTYPES, EmbeddingMatrix, compare_faces,
+                            cosine_similarity, match_batch)
+
+
+def per_pair(queries: np.ndarray, gallery: np.ndarray, threshold: float):
+    best = []
+    for query in queries:
+        sims = [cosine_similarity(query, row) for row in gallery]
+        row = int(np.argmax(sims))
+        compare_faces(query, gallery[row], threshold)
+        best.append(row)
+    return np.array(best)
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs per-pair similarity")
+    parser.add_argument("--gallery", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--threshold", type=float, default=0.4)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for size in args.gallery:
+        gallery = rng.standard_normal((size, args.dim), dtype=np.float32)
+        index = FaceIndex(args.dim)
+        index.build([str(row) for row in range(size)], gallery)
+        indexes = {"float32": index, **{dtype: EmbeddingMatrix.from_index(index, dtype)
+                                        for dtype in STORAGE_DTYPES if dtype != "float32"}}
+        for count in args.queries:
+            picked = rng.choice(size, count)
+            queries = gallery[picked] + 0.5 * rng.standard_normal((count, args.dim), dtype=np.float32)
+
+            loop_ms, expected = timed(lambda: per_pair(queries, gallery, args.threshold),
+                                      max(1, args.repeat // 10))
+            print(f"G={size:<7d} Q={count:<3d} per-pair  {loop_ms:9.2f} ms")
+            for dtype, gallery_index in indexes.items():
+                ms, matches = timed(lambda: match_batch(queries, gallery_index, args.threshold),
+                                    args.repeat)
+                agree = np.mean(matches.ids[:, 0].astype(int) == expected)
+                print(f"{'':15s}{dtype:8s}  {ms:9.3f} ms  {loop_ms / ms:7.0f}x  "
+                      f"top-1 agreement {agree:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Import time and first-request latency of the API process.
+
+Each scenario runs in a fresh interpreter so module caches do not carry
+over: how long `import main` takes, how long loading + warming the models
+takes, and how long the first and a later detection call take with and
+without warm-up.
+
+Run from backend/:
+    python -m benchmarks.startup --image ./data/uploaded_photos/profile.jpg
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+SCENARIO = r"""
+import json, sys, time
+import cv2
+import numpy as np
+
+start = time.perf_counter()
+import main
+from app.routes.route import MODELS, detection
+from ml.registry import registry
+result = {"import_ms": (time.perf_counter() - start) * 1000}
+
+frame = cv2.imread(sys.argv[1]) if sys.argv[1] else None
+if frame is None:
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+if sys.argv[2] == "warm":
+    start = time.perf_counter()
+    registry.warm_up(MODELS)
+    result["warm_up_ms"] = (time.perf_counter() - start) * 1000
+
+for label in ("first_request_ms", "second_request_ms"):
+    start = time.perf_counter()
+    detection.process(frame)
+    result[label] = (time.perf_counter() - start) * 1000
+result["models"] = registry.status()
+print(json.dumps(result))
+"""
+
+
+def run(image: str, mode: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", SCENARIO, image, mode],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API import and first-request latency")
+    parser.add_argument("--image", default="", help="test photo (default: blank frame)")
+    args = parser.parse_args()
+
+    for mode in ("lazy", "warm"):
+        r = run(args.image, mode)
+        print(f"{mode:5s} import {r['import_ms']:7.0f} ms  "
+              f"warm-up {r.get('warm_up_ms', 0):7.0f} ms  "
+              f"first request {r['first_request_ms']:7.0f} ms  "
+              f"second request {r['second_request_ms']:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# gunicorn -c gunicorn.conf.py main:app
+#
+# Set GALLERY_SHARED_DIR so workers share one memory-mapped gallery, and
+# PIN_WORKERS=1 to give each worker its own CPUs and matching thread pools.
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Model warm-up happens in each worker's startup hook
+timeout = 120
+
+PIN_WORKERS = os.getenv("PIN_WORKERS", "0") == "1"
+
+
+def on_starting(server):
+    # Import insightface / ONNX Runtime (and TensorFlow for MTCNN) once in the
+    # master so forked workers share those pages. No inference session is
+    # created here: ONNX Runtime thread pools do not survive fork(). The app
+    # config is not imported either, so workers read it after pinning.
+    from ml.registry import registry
+
+    mtcnn = os.getenv("FACE_DETECTOR", "retinaface").lower() == "mtcnn"
+    registry.import_modules(["arcface"] + (["mtcnn"] if mtcnn else []))
+
+
+def pre_fork(server, worker):
+    # Lowest CPU slot not held by a live worker, so respawns reuse it
+    used = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    if PIN_WORKERS:
+        from app.core.workers import pin_worker
+
+        cpus = pin_worker(worker.cpu_slot, server.num_workers)
+        server.log.info(f"Worker {worker.pid} pinned to CPUs {cpus}")
@@ -1,9 +1,22 @@
+import asyncio
+import time
+
+_import_start = time.perf_counter()
+
 from fastapi import FastAPI
-from app.core.database import connect_to_mongo
-from app.routes.route import router as info_router
+from app.core.database import connect_to_mongo, person_collection
+from app.core.executor import inference_executor
+from app.core.config import STREAMS_CONFIG, MODEL_LOAD
+from app.core.gallery import gallery
+from app.core.profiler import slow_frame_profiler
+from app.routes.route import router as info_router, ingestion, MODELS
+from ml.alert_system import alerts
+from ml.ingest import load_stream_configs
+from ml.registry import registry
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="My FastAPI + MongoDB Project")
+print(f"⏱️ App imported in {(time.perf_counter() - _import_start) * 1000:.0f} ms")
 
 
 app.add_middleware(
@@ -17,7 +30,25 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def on_startup():
+    if slow_frame_profiler is not None:
+        slow_frame_profiler.start()
+    if MODEL_LOAD == "startup":
+        await asyncio.to_thread(registry.warm_up, MODELS)
+    elif MODEL_LOAD == "background":
+        app.state.warm_up = asyncio.create_task(asyncio.to_thread(registry.warm_up, MODELS))
     await connect_to_mongo()
+    await gallery.start(person_collection())
+    if STREAMS_CONFIG:
+        for stream in load_stream_configs(STREAMS_CONFIG):
+            ingestion.add_stream(stream)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await gallery.stop()
+    ingestion.stop()
+    alerts.close()
+    inference_executor.shutdown()
 
 
 app.include_router(info_router, prefix="/api")
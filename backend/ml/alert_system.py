@@ -1,45 +1,294 @@
+"""
+Match alerts.
+
+send_alert() only enqueues: a background thread encodes the JPEG and hands
+the alert to each sink (file, webhook, MongoDB). Alerts for the same person
+on the same camera within ALERT_COOLDOWN_SECONDS are dropped before they
+are queued, and every delivered alert is appended to an NDJSON log so
+counting and listing never touch the snapshot directory.
+
+A stub webhook receiver for local testing:
+
+    python -m ml.alert_system --stub-webhook 8765
+"""
 import cv2
+import json
 import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
 from loguru import logger
-from ..app.config import settings
+from app.core.config import (
+    ALERTS_DIR,
+    ALERT_COOLDOWN_SECONDS,
+    ALERT_QUEUE_SIZE,
+    ALERT_SINKS,
+    ALERT_WEBHOOK_URL,
+    MONGO_URI,
+)
 
+os.makedirs(ALERTS_DIR, exist_ok=True)
 
-def send_alert(similarity: float, frame, person_id: Optional[str] = None, location: Optional[str] = None) -> str:
-    """Send alert and save match frame"""
-    try:
-        # Create timestamp for filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sim_str = f"{similarity:.3f}".replace(".", "")
-        
-        # Generate filename
-        filename = f"match_{timestamp}_sim_{sim_str}.jpg"
-        file_path = os.path.join(settings.alerts_dir, filename)
-        
-        # Save frame
-        cv2.imwrite(file_path, frame)
-        
-        # Log alert
-        logger.warning(f"🚨 ALERT: Match found! Similarity: {similarity:.3f}, Saved: {file_path}")
-        
-        # Here you can add more alert mechanisms:
-        # - Send email notification
-        # - Send SMS
-        # - Push notification
-        # - Webhook to external system
-        
-        return file_path
-        
-    except Exception as e:
-        logger.error(f"Error sending alert: {e}")
-        return ""
+
+@dataclass
+class Alert:
+    similarity: float
+    person_id: Optional[str] = None
+    location: Optional[str] = None
+    frame: Optional[np.ndarray] = field(default=None, repr=False)
+    id: str = field(default_factory=lambda: uuid4().hex)
+    timestamp: float = field(default_factory=time.time)
+    # Set by FileSink
+    image_path: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "timestamp": self.timestamp, "similarity": self.similarity,
+                "person_id": self.person_id, "location": self.location,
+                "image": self.image_path}
+
+
+class AlertSink:
+    """Delivers alerts; runs on the pipeline's writer thread"""
+
+    def handle(self, alert: Alert):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(AlertSink):
+    """JPEG snapshot of the matching frame in a directory"""
+
+    def __init__(self, directory: str = ALERTS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def handle(self, alert: Alert):
+        if alert.frame is None:
+            return
+        ok, jpeg = cv2.imencode(".jpg", alert.frame)
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        timestamp = datetime.fromtimestamp(alert.timestamp).strftime("%Y%m%d_%H%M%S")
+        sim_str = f"{alert.similarity:.3f}".replace(".", "")
+        filename = f"match_{timestamp}_sim_{sim_str}_{alert.id[:8]}.jpg"
+        path = os.path.join(self.directory, filename)
+        with open(path, "wb") as f:
+            f.write(jpeg.tobytes())
+        alert.image_path = path
+
+
+class WebhookSink(AlertSink):
+    """POST the alert as JSON (without the image) to a URL"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def handle(self, alert: Alert):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(alert.to_dict()).encode(),
+            headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class MongoSink(AlertSink):
+    """Insert the alert into a MongoDB collection"""
+
+    def __init__(self, uri: str = MONGO_URI, collection: str = "Alert"):
+        from pymongo import MongoClient
+
+        self._client = MongoClient(uri)
+        self._collection = self._client.get_default_database()[collection]
+
+    def handle(self, alert: Alert):
+        doc = alert.to_dict()
+        doc["_id"] = doc.pop("id")
+        doc["timestamp"] = datetime.fromtimestamp(alert.timestamp)
+        self._collection.insert_one(doc)
+
+    def close(self):
+        self._client.close()
+
+
+class AlertLog:
+    """
+    Append-only NDJSON index of delivered alerts.
+    Read once at startup; after that counts and recent alerts come from memory.
+    """
+
+    def __init__(self, path: str, keep_recent: int = 1000):
+        self.path = path
+        self.total = 0
+        self.by_person: Dict[Optional[str], int] = {}
+        self._recent: deque = deque(maxlen=keep_recent)
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: dict):
+        self.total += 1
+        person = entry.get("person_id")
+        self.by_person[person] = self.by_person.get(person, 0) + 1
+        self._recent.append(entry)
+
+    def append(self, alert: Alert):
+        entry = alert.to_dict()
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index(entry)
+
+    def count(self, person_id: Optional[str] = None) -> int:
+        return self.total if person_id is None else self.by_person.get(person_id, 0)
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+
+class AlertPipeline:
+    """Bounded alert queue with per-(person, camera) cooldown and a writer thread"""
+
+    def __init__(self, sinks: List[AlertSink], log: AlertLog, cooldown: float = 30.0,
+                 queue_size: int = 64):
+        self.sinks = sinks
+        self.log = log
+        self.cooldown = cooldown
+        self.submitted = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._last: Dict[Tuple[Optional[str], Optional[str]], float] = {}
+        self._prune_at = 256
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, similarity: float, frame=None, person_id: Optional[str] = None,
+               location: Optional[str] = None) -> bool:
+        """Queue an alert unless it repeats a recent one; never blocks"""
+        key = (person_id, location)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.cooldown:
+                self.suppressed += 1
+                return False
+            self._last[key] = now
+            if len(self._last) >= self._prune_at:
+                self._prune(now)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="alert-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(Alert(float(similarity), person_id, location, frame))
+        except queue.Full:
+            # Not delivered, so it must not start a cooldown
+            with self._lock:
+                if self._last.get(key) == now:
+                    if last is None:
+                        del self._last[key]
+                    else:
+                        self._last[key] = last
+            self.dropped += 1
+            logger.warning("Alert queue full, alert dropped")
+            return False
+        self.submitted += 1
+        return True
+
+    def _prune(self, now: float):
+        """Forget keys whose cooldown has expired; called with the lock held"""
+        self._last = {key: at for key, at in self._last.items() if now - at < self.cooldown}
+        self._prune_at = max(256, 2 * len(self._last))
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            if alert is None:
+                self._queue.task_done()
+                return
+            try:
+                self._deliver(alert)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, alert: Alert):
+        for sink in self.sinks:
+            try:
+                sink.handle(alert)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Alert sink {type(sink).__name__} failed: {e}")
+        alert.frame = None
+        self.log.append(alert)
+        logger.warning(
+            f"🚨 ALERT: Match found! Similarity: {alert.similarity:.3f}, "
+            f"person: {alert.person_id}, location: {alert.location}, saved: {alert.image_path}")
+
+    def stats(self) -> dict:
+        return {"submitted": self.submitted, "suppressed": self.suppressed,
+                "dropped": self.dropped, "failed": self.failed,
+                "queued": self._queue.qsize(), "total": self.log.count()}
+
+    def flush(self):
+        """Block until every queued alert has been delivered"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued alerts and close the sinks"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        for sink in self.sinks:
+            sink.close()
+
+
+def create_sinks(names: List[str]) -> List[AlertSink]:
+    sinks = []
+    for name in names:
+        if name == "file":
+            sinks.append(FileSink(ALERTS_DIR))
+        elif name == "webhook":
+            if not ALERT_WEBHOOK_URL:
+                raise ValueError("ALERT_SINKS includes webhook but ALERT_WEBHOOK_URL is not set")
+            sinks.append(WebhookSink(ALERT_WEBHOOK_URL))
+        elif name == "mongo":
+            sinks.append(MongoSink(MONGO_URI))
+        else:
+            raise ValueError(f"Unknown alert sink '{name}', expected file, webhook or mongo")
+    return sinks
+
+
+alerts = AlertPipeline(create_sinks(ALERT_SINKS), AlertLog(os.path.join(ALERTS_DIR, "alerts.ndjson")),
+                       cooldown=ALERT_COOLDOWN_SECONDS, queue_size=ALERT_QUEUE_SIZE)
+
+
+def send_alert(similarity: float, frame, person_id: Optional[str] = None, location: Optional[str] = None) -> bool:
+    """Queue an alert for a match; False when it was de-duplicated or dropped"""
+    return alerts.submit(similarity, frame, person_id=person_id, location=location)
 
 
 def save_latest_match(frame, similarity: float) -> str:
     """Save the latest match frame for quick access"""
     try:
-        file_path = os.path.join(settings.alerts_dir, "latest_match.jpg")
+        file_path = os.path.join(ALERTS_DIR, "latest_match.jpg")
         cv2.imwrite(file_path, frame)
         logger.info(f"Latest match saved: {file_path}")
         return file_path
@@ -50,9 +299,26 @@ def save_latest_match(frame, similarity: float) -> str:
 
 def get_alert_count() -> int:
     """Get total number of alerts"""
-    try:
-        alert_files = [f for f in os.listdir(settings.alerts_dir) if f.startswith("match_")]
-        return len(alert_files)
-    except Exception as e:
-        logger.error(f"Error counting alerts: {e}")
-        return 0
+    return alerts.log.count()
+
+
+def _stub_webhook(port: int):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            print(f"📨 {body.decode()}")
+            self.send_response(204)
+            self.end_headers()
+
+    print(f"✅ Stub webhook listening on http://127.0.0.1:{port}/")
+    HTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Alert pipeline utilities")
+    parser.add_argument("--stub-webhook", type=int, metavar="PORT", required=True)
+    _stub_webhook(parser.parse_args().stub_webhook)
@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic batcher in front of the ArcFace recognition model.
+    Aligned crops submitted by any session within window_ms of each other
+    are stacked into one ONNX call and the rows are handed back to each caller.
+    """
+
+    def __init__(self, rec_model, window_ms: float = 10, max_batch: int = 32):
+        self.rec_model = rec_model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, crops: List[np.ndarray]) -> Future:
+        """Queue crops for the next batch; the future resolves to (N, 512)"""
+        future: Future = Future()
+        self._queue.put((crops, future))
+        return future
+
+    def embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Blocking helper for worker threads"""
+        return self.submit(crops).result()
+
+    @property
+    def queued(self) -> int:
+        """Submissions waiting for a batch"""
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=1)
+
+    def _collect(self, first):
+        batch = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then let the loop see the stop marker
+                self._queue.put(None)
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._run(self._collect(first))
+
+    def _run(self, batch):
+        crops = [crop for item_crops, _ in batch for crop in item_crops]
+        try:
+            feats = self.rec_model.get_feat(crops)
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(crops)} faces: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(crops)
+        offset = 0
+        for item_crops, future in batch:
+            future.set_result(feats[offset:offset + len(item_crops)])
+            offset += len(item_crops)
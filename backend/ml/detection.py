@@ -0,0 +1,317 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Union
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from ml.registry import registry
+
+# MTCNN keypoint names in the order ArcFace alignment expects
+MTCNN_KEYPOINTS = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+
+DETECTORS = ("retinaface", "mtcnn")
+
+DET_SIZES = (320, 480, 640)
+
+
+def _no_faces():
+    return (np.empty((0, 4), dtype=np.int32), np.empty((0, 5, 2), dtype=np.float32),
+            np.empty(0, dtype=np.float32))
+
+
+def landmark_boxes(landmarks: np.ndarray) -> np.ndarray:
+    """
+    Approximate face boxes from (N, 5, 2) landmarks: the eyes-to-mouth
+    extent covers about half the face, so a square twice its size
+    """
+    if len(landmarks) == 0:
+        return np.empty((0, 4), dtype=np.float32)
+    low, high = landmarks.min(axis=1), landmarks.max(axis=1)
+    center = (low + high) / 2
+    half = (high - low).max(axis=1, keepdims=True)
+    return np.hstack([center - half, center + half]).astype(np.float32)
+
+
+class AdaptiveDetSize:
+    """
+    Picks the RetinaFace input size for each frame from recent face sizes.
+    A face h pixels tall in a frame whose long side is L shows up as
+    h * size / L pixels at the detector input, so the smallest size that
+    keeps the smallest recent face above min_face_px is enough. Sizes go up
+    at once when faces shrink, down only after `patience` frames agree, and
+    back to the largest size after `patience` frames without faces.
+    """
+
+    def __init__(self, sizes: Sequence[int] = DET_SIZES, min_face_px: int = 48,
+                 patience: int = 5):
+        self.sizes = sorted(sizes)
+        self.min_face_px = min_face_px
+        self.patience = patience
+        self.current = self.sizes[-1]
+        self._lower_votes = 0
+        self._empty = 0
+
+    def size(self) -> int:
+        return self.current
+
+    def observe(self, boxes: np.ndarray, frame_shape):
+        if len(boxes) == 0:
+            self._empty += 1
+            self._lower_votes = 0
+            if self._empty >= self.patience:
+                self.current = self.sizes[-1]
+            return
+        self._empty = 0
+        smallest = float(np.min(boxes[:, 3] - boxes[:, 1]))
+        long_side = max(frame_shape[:2])
+        needed = next((s for s in self.sizes if smallest * s / long_side >= self.min_face_px),
+                      self.sizes[-1])
+        if needed > self.current:
+            self.current = needed
+            self._lower_votes = 0
+        elif needed < self.current:
+            self._lower_votes += 1
+            if self._lower_votes >= self.patience:
+                self.current = needed
+                self._lower_votes = 0
+        else:
+            self._lower_votes = 0
+
+
+DetSize = Union[int, AdaptiveDetSize, None]
+
+
+def make_det_size(value, sizes: Sequence[int] = DET_SIZES, min_face_px: int = 48) -> DetSize:
+    """Parse a det_size setting: None, a pixel size, or adaptive"""
+    if value is None or value == "":
+        return None
+    if str(value).lower() == "adaptive":
+        return AdaptiveDetSize(sizes, min_face_px)
+    size = int(value)
+    if size <= 0 or size % 32:
+        raise ValueError(f"det_size must be a positive multiple of 32, got {value}")
+    return size
+
+
+@dataclass
+class FaceDetections:
+    """
+    Every face found by a single detection pass, as stacked arrays: (N, 4)
+    x1, y1, x2, y2 boxes, (N,) detector scores, (N, 5, 2) landmarks and
+    (N, 512) embeddings, row i describing the same face in each
+    """
+    boxes: np.ndarray
+    embeddings: np.ndarray
+    scores: Optional[np.ndarray] = None
+    landmarks: Optional[np.ndarray] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Set when a tracker is used: track id per face and how many were re-embedded
+    track_ids: Optional[np.ndarray] = None
+    embedded: int = 0
+    # True when the motion gate judged the frame static and nothing ran
+    skipped: bool = False
+    # RetinaFace input size used for this frame
+    det_size: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def largest(self) -> int:
+        """Row of the biggest face, e.g. the subject of an enrollment photo"""
+        areas = (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+        return int(np.argmax(areas))
+
+
+class DetectionStage:
+    """
+    Shared detection + embedding stage.
+    Faces are detected once (RetinaFace or MTCNN) and the same landmarks
+    are used to align the crops for ArcFace, so no frame is detected twice.
+    arcface and batcher may be zero-argument callables (registry.lazy) that
+    are resolved on first use; by default the shared registry model is used.
+    """
+
+    def __init__(self, arcface=None, detector: str = "retinaface", batcher=None,
+                 det_size: Optional[int] = None):
+        if detector not in DETECTORS:
+            raise ValueError(
+                f"Unknown face detector '{detector}', expected one of {DETECTORS}")
+        self._arcface = arcface if arcface is not None else registry.lazy("arcface")
+        self._batcher = batcher
+        self.detector = detector
+        # Default RetinaFace input size when process() is not given one
+        self.det_size = det_size
+        logger.info(f"Detection stage ready ({detector})")
+
+    @property
+    def arcface(self):
+        if callable(self._arcface):
+            self._arcface = self._arcface()
+        return self._arcface
+
+    @property
+    def variant(self) -> str:
+        """Names the models and settings behind results, e.g. for cache keys"""
+        if self.detector == "mtcnn":
+            detector = "mtcnn"
+        else:
+            detector = f"retinaface{self.det_size or self.arcface.det_size}"
+        quantized = getattr(self.arcface, "quantized", None)
+        return f"{detector}-{'int8-' + '+'.join(quantized) if quantized else 'fp32'}"
+
+    @property
+    def batcher(self):
+        if callable(self._batcher):
+            self._batcher = self._batcher()
+        return self._batcher
+
+    def _detect_mtcnn(self, frame: np.ndarray):
+        results = registry.get("mtcnn").detect_faces(
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if not results:
+            return _no_faces()
+
+        boxes = np.array([r["box"] for r in results], dtype=np.int32)
+        boxes[:, 2:] += boxes[:, :2]
+        landmarks = np.array(
+            [[r["keypoints"][k] for k in MTCNN_KEYPOINTS] for r in results],
+            dtype=np.float32)
+        scores = np.array([r["confidence"] for r in results], dtype=np.float32)
+        return boxes, landmarks, scores
+
+    def _detect(self, frame: np.ndarray, roi=None, det_size: Optional[int] = None):
+        if roi is not None:
+            # Detect on the motion region only, then map back to the full frame
+            x1, y1, x2, y2 = roi
+            boxes, landmarks, scores = self._detect(frame[y1:y2, x1:x2], det_size=det_size)
+            return boxes + np.array([x1, y1, x1, y1], dtype=boxes.dtype), \
+                landmarks + np.array([x1, y1], dtype=landmarks.dtype), scores
+        if self.detector == "mtcnn":
+            return self._detect_mtcnn(frame)
+        bboxes, landmarks = self.arcface.detect(frame, det_size)
+        return bboxes[:, :4].astype(np.int32), landmarks, bboxes[:, 4].astype(np.float32)
+
+    def _embed(self, frame: np.ndarray, landmarks: np.ndarray) -> np.ndarray:
+        if self.batcher is None or len(landmarks) == 0:
+            return self.arcface.get_embeddings(frame, landmarks)
+        return self.batcher.embed(self.arcface.align(frame, landmarks))
+
+    def _embed_tracked(self, frame: np.ndarray, boxes: np.ndarray,
+                       landmarks: np.ndarray, tracker):
+        """Embed only the faces the tracker wants re-recognised"""
+        tracks, needs = tracker.update(boxes)
+        if needs.any():
+            fresh = self._embed(frame, landmarks[needs])
+            for track, embedding in zip((t for t, n in zip(tracks, needs) if n), fresh):
+                tracker.set_embedding(track, embedding)
+
+        embeddings = np.empty((len(tracks), self.arcface.embedding_size), dtype=np.float32)
+        for row, track in enumerate(tracks):
+            embeddings[row] = track.embedding
+        track_ids = np.array([t.id for t in tracks], dtype=np.int64)
+        return embeddings, track_ids, int(needs.sum())
+
+    def process_faces(self, frame: np.ndarray, landmarks: np.ndarray,
+                      boxes: Optional[np.ndarray] = None, tracker=None) -> FaceDetections:
+        """
+        Embed faces the client already located, without running the detector.
+        landmarks are (N, 5, 2) points in frame pixels; boxes, (N, 4), default
+        to a square around each face's landmarks.
+        """
+        start = time.perf_counter()
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+        if boxes is None:
+            boxes = landmark_boxes(landmarks)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4).astype(np.int32)
+        if len(boxes) != len(landmarks):
+            raise ValueError(f"{len(boxes)} boxes for {len(landmarks)} sets of landmarks")
+        if tracker is None:
+            embeddings = self._embed(frame, landmarks)
+            track_ids, embedded = None, len(embeddings)
+        else:
+            embeddings, track_ids, embedded = self._embed_tracked(
+                frame, boxes, landmarks, tracker)
+        return FaceDetections(
+            boxes=boxes,
+            embeddings=embeddings,
+            scores=np.ones(len(boxes), dtype=np.float32),
+            landmarks=landmarks,
+            timings={"embed_ms": (time.perf_counter() - start) * 1000},
+            track_ids=track_ids,
+            embedded=embedded,
+        )
+
+    def process_aligned(self, crops: Sequence[np.ndarray]) -> FaceDetections:
+        """Embed crops that are already aligned at the recognition input size"""
+        start = time.perf_counter()
+        crops = self.arcface.check_aligned(crops)
+        if self.batcher is None or not crops:
+            embeddings = self.arcface.embed_aligned(crops)
+        else:
+            embeddings = self.batcher.embed(crops)
+        return FaceDetections(
+            boxes=np.array([[0, 0, c.shape[1], c.shape[0]] for c in crops],
+                           dtype=np.int32).reshape(-1, 4),
+            embeddings=embeddings,
+            scores=np.ones(len(crops), dtype=np.float32),
+            landmarks=np.zeros((len(crops), 5, 2), dtype=np.float32),
+            timings={"embed_ms": (time.perf_counter() - start) * 1000},
+            embedded=len(crops),
+        )
+
+    def process(self, frame: np.ndarray, tracker=None, gate=None,
+                det_size: DetSize = None) -> FaceDetections:
+        """
+        Detect every face in a frame and embed them from the same pass.
+        With a FaceTracker, faces on stable tracks reuse their last embedding.
+        With a MotionGate, static frames are skipped and detection is limited
+        to the moving region when it is small.
+        det_size is a RetinaFace input size or an AdaptiveDetSize kept per
+        stream; None uses the model default.
+        """
+        start = time.perf_counter()
+        roi = None
+        if gate is not None:
+            motion = gate.check(frame)
+            if not motion.active:
+                boxes, landmarks, scores = _no_faces()
+                return FaceDetections(
+                    boxes=boxes,
+                    embeddings=np.empty((0, self.arcface.embedding_size), dtype=np.float32),
+                    scores=scores,
+                    landmarks=landmarks,
+                    timings={"gate_ms": (time.perf_counter() - start) * 1000},
+                    skipped=True,
+                )
+            roi = motion.roi
+        gated = time.perf_counter()
+        size = det_size.size() if isinstance(det_size, AdaptiveDetSize) else det_size
+        size = size or self.det_size
+        boxes, landmarks, scores = self._detect(frame, roi, size)
+        detected = time.perf_counter()
+        if isinstance(det_size, AdaptiveDetSize):
+            det_size.observe(boxes, frame.shape)
+        if tracker is None:
+            embeddings = self._embed(frame, landmarks)
+            track_ids, embedded = None, len(embeddings)
+        else:
+            embeddings, track_ids, embedded = self._embed_tracked(
+                frame, boxes, landmarks, tracker)
+        embedded_at = time.perf_counter()
+
+        return FaceDetections(
+            boxes=boxes,
+            embeddings=embeddings,
+            scores=scores,
+            landmarks=landmarks,
+            timings={
+                "gate_ms": (gated - start) * 1000,
+                "detect_ms": (detected - gated) * 1000,
+                "embed_ms": (embedded_at - detected) * 1000,
+            },
+            track_ids=track_ids,
+            embedded=embedded,
+            det_size=None if self.detector == "mtcnn" else size or self.arcface.det_size,
+        )
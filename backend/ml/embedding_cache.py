@@ -0,0 +1,124 @@
+"""
+Content-addressed cache of face detection/embedding results.
+
+Keys are an image's content digest plus the variant of the models that
+produced the result, values a few numpy arrays (boxes, landmarks,
+embeddings, ...). Recent results live in an in-memory LRU bounded by
+bytes; with a directory set, every result is also written there as .npz so
+it survives restarts and is shared between worker processes.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import EMBED_CACHE_DIR, EMBED_CACHE_MB
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 of encoded image bytes; the same digest the image store uses"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def frame_digest(frame: np.ndarray) -> str:
+    """Digest of decoded pixels, for frames that never were encoded bytes"""
+    h = hashlib.blake2b(digest_size=32)
+    h.update(str(frame.shape).encode())
+    h.update(np.ascontiguousarray(frame).data)
+    return h.hexdigest()
+
+
+def _nbytes(arrays: Dict[str, np.ndarray]) -> int:
+    return sum(a.nbytes for a in arrays.values())
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU, optional disk) digest -> arrays cache"""
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        name = key.replace("/", "_").replace(":", "_")
+        return os.path.join(self.directory, name[:2], f"{name}.npz")
+
+    def _remember(self, key: str, arrays: Dict[str, np.ndarray]):
+        size = _nbytes(arrays)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= _nbytes(old)
+            self._entries[key] = arrays
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= _nbytes(evicted)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        with self._lock:
+            arrays = self._entries.get(key)
+            if arrays is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return arrays
+        if self.directory:
+            try:
+                with np.load(self._path(key)) as data:
+                    arrays = {name: data[name] for name in data.files}
+            except (OSError, ValueError):
+                arrays = None
+            if arrays is not None:
+                self.disk_hits += 1
+                self._remember(key, arrays)
+                return arrays
+        self.misses += 1
+        return None
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]):
+        arrays = {name: np.asarray(a) for name, a in arrays.items() if a is not None}
+        self._remember(key, arrays)
+        if self.directory:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "directory": self.directory,
+        }
+
+
+embedding_cache = EmbeddingCache(int(EMBED_CACHE_MB * 1024 * 1024), EMBED_CACHE_DIR or None)
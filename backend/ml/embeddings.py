@@ -1,13 +1,13 @@
-from models.arcface.index import ArcFaceModel
+from ml.detection import DetectionStage
+from ml.embedding_cache import embedding_cache, frame_digest
+from ml.recognition import cosine_similarity
+from ml.registry import registry
 import os
 import cv2
 import numpy as np
 import sys
 sys.path.append('.')
 
-# Initialize ArcFace
-arcface = ArcFaceModel(ctx_id=0)
-
 
 def process_uploaded_photo(photo_path, person_name):
     """
@@ -38,7 +38,10 @@ def process_uploaded_photo(photo_path, person_name):
 
     # Get embedding
     print("🔍 Detecting face and extracting embedding...")
-    embedding = arcface.get_embedding_from_frame(img)
+    arcface = registry.get("arcface")
+    # Keyed on the decoded pixels, since the photo was preprocessed above
+    key = f"{frame_digest(img)}/frame-{DetectionStage(arcface).variant}"
+    embedding = arcface.get_embedding_from_frame(img, cache=embedding_cache, cache_key=key)
 
     if embedding is None:
         print("❌ No face detected in uploaded photo.")
@@ -57,10 +60,3 @@ def process_uploaded_photo(photo_path, person_name):
     # Test the embedding quality
     test_similarity = cosine_similarity(embedding, embedding)
     print(f"🧪 Self-similarity test: {test_similarity:.3f} (should be 1.0)")
-
-
-def cosine_similarity(a, b):
-    """Calculate cosine similarity between two vectors"""
-    from numpy import dot
-    from numpy.linalg import norm
-    return dot(a, b) / (norm(a) * norm(b))
@@ -0,0 +1,117 @@
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize rows as float32; zero rows stay zero"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def top_k(scores: np.ndarray, ids, k: int) -> List[List[Tuple[str, float]]]:
+    """Best k (id, score) pairs per row of a (queries x gallery) score matrix"""
+    size = scores.shape[1]
+    if size == 0:
+        return [[] for _ in range(len(scores))]
+    k = min(k, size)
+    if k < size:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(size), scores.shape)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [[(str(ids[j]), float(s)) for j, s in zip(row, row_scores)]
+            for row, row_scores in zip(top, top_scores)]
+
+
+class FaceIndex:
+    """
+    Exact 1:N face index.
+    All embeddings live in one L2-normalized float32 matrix so a top-k query
+    is a single matrix multiply. Rows are appended in place (the buffer grows
+    by doubling) so enrolling a person never rebuilds the whole matrix.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self._ids: List[str] = []
+        self._rows = {}
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._rows
+
+    def build(self, ids: Iterable[str], embeddings: np.ndarray):
+        """Replace the whole index"""
+        ids = list(ids)
+        matrix = normalize(embeddings) if ids else np.empty(
+            (0, self.dim), dtype=np.float32)
+        with self._lock:
+            self._ids = ids
+            self._rows = {id: row for row, id in enumerate(ids)}
+            self._matrix = matrix
+
+    def add(self, id: str, embedding: np.ndarray):
+        """Insert or replace a single embedding"""
+        vector = normalize(embedding)[0]
+        with self._lock:
+            row = self._rows.get(id)
+            if row is not None:
+                # Copy so searches holding the old matrix never see a torn row
+                self._matrix = self._matrix.copy()
+                self._matrix[row] = vector
+                return
+            size = len(self._ids)
+            if size == len(self._matrix):
+                grown = np.empty((max(16, size * 2), self.dim), dtype=np.float32)
+                grown[:size] = self._matrix[:size]
+                self._matrix = grown
+            self._matrix[size] = vector
+            self._ids.append(id)
+            self._rows[id] = size
+
+    def get(self, id: str) -> Optional[np.ndarray]:
+        """Normalized embedding stored for id, or None"""
+        with self._lock:
+            row = self._rows.get(id)
+            return None if row is None else self._matrix[row].copy()
+
+    def remove(self, id: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(id, None)
+            if row is None:
+                return False
+            keep = np.ones(len(self._ids), dtype=bool)
+            keep[row] = False
+            self._matrix = self._matrix[:len(self._ids)][keep]
+            del self._ids[row]
+            self._rows = {id: row for row, id in enumerate(self._ids)}
+            return True
+
+    def export(self) -> Tuple[List[str], np.ndarray]:
+        """Copy of every id and its normalized embedding"""
+        with self._lock:
+            size = len(self._ids)
+            return self._ids[:], self._matrix[:size].copy()
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k cosine matches for each query row
+        Returns: one list of (id, similarity) per query, best first
+        """
+        queries = normalize(queries)
+        with self._lock:
+            size = len(self._ids)
+            matrix = self._matrix[:size]
+            ids = self._ids[:]
+        return top_k(queries @ matrix.T, ids, k)
@@ -0,0 +1,104 @@
+import base64
+import glob
+import os
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Binary WebSocket frame: little-endian header followed by raw JPEG bytes.
+#   uint32  sequence number
+#   float64 client timestamp (ms since epoch)
+#   uint16  width hint, uint16 height hint (0 = none); boxes are scaled to it
+FRAME_HEADER = struct.Struct("<IdHH")
+
+# Sessions opened with ?input=landmarks put the faces the client located
+# between the header and the JPEG:
+#   uint16  face count N
+#   N x 14 float32: box x1, y1, x2, y2 then five (x, y) landmarks
+# in the JPEG's pixel coordinates.
+FACE_COUNT = struct.Struct("<H")
+FACE_VALUES = 14
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameHeader(NamedTuple):
+    seq: int
+    timestamp: float
+    width: int
+    height: int
+
+
+def decode_data_url(data: str) -> np.ndarray:
+    """Decode a base64 image (optionally a data: URL) into a BGR frame"""
+    img_data = base64.b64decode(data.split(",")[-1])
+    return decode_jpeg(img_data)
+
+
+def decode_jpeg(data, offset: int = 0) -> np.ndarray:
+    """Decode encoded image bytes without copying them first"""
+    np_arr = np.frombuffer(data, np.uint8, offset=offset)
+    img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Decoded image is None")
+    return img
+
+
+def load_images(directory: str) -> List[np.ndarray]:
+    """Every readable image in a directory as BGR frames, in name order"""
+    paths = sorted(p for p in glob.glob(os.path.join(directory, "*"))
+                   if p.lower().endswith(IMAGE_EXTENSIONS))
+    images = [cv2.imread(p) for p in paths]
+    return [img for img in images if img is not None]
+
+
+def parse_frame_header(message: bytes) -> FrameHeader:
+    if len(message) <= FRAME_HEADER.size:
+        raise ValueError(f"Binary frame too short ({len(message)} bytes)")
+    return FrameHeader(*FRAME_HEADER.unpack_from(message))
+
+
+def decode_binary_frame(message: bytes) -> np.ndarray:
+    """Decode the JPEG payload that follows the binary frame header"""
+    return decode_jpeg(message, offset=FRAME_HEADER.size)
+
+
+def decode_upload(data: str):
+    """Decode a base64 upload; returns the encoded bytes and the BGR frame"""
+    img_data = base64.b64decode(data.split(",")[-1])
+    return img_data, decode_jpeg(img_data)
+
+
+def parse_faces(message: bytes, offset: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Client face records at offset; returns (N, 4) boxes, (N, 5, 2) landmarks and the JPEG offset"""
+    if len(message) < offset + FACE_COUNT.size:
+        raise ValueError("Binary frame too short for the face count")
+    (count,) = FACE_COUNT.unpack_from(message, offset)
+    offset += FACE_COUNT.size
+    end = offset + count * FACE_VALUES * 4
+    if len(message) <= end:
+        raise ValueError(f"Binary frame too short for {count} faces")
+    values = np.frombuffer(message, "<f4", count * FACE_VALUES, offset).reshape(count, FACE_VALUES)
+    return values[:, :4].copy(), values[:, 4:].reshape(count, 5, 2).copy(), end
+
+
+def decode_binary_faces(message: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Frame plus client-located faces from a binary ?input=landmarks message"""
+    boxes, landmarks, offset = parse_faces(message, FRAME_HEADER.size)
+    return decode_jpeg(message, offset), boxes, landmarks
+
+
+def decode_json_faces(message: dict) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+    Frame plus client-located faces from a JSON ?input=landmarks message:
+    {"frame": data URL, "faces": [{"bbox": [x1, y1, x2, y2], "landmarks": [[x, y] x 5]}]}
+    bbox is optional; boxes are None unless every face has one.
+    """
+    faces = message.get("faces") or []
+    landmarks = np.array([f["landmarks"] for f in faces], dtype=np.float32).reshape(-1, 5, 2)
+    boxes = None
+    if all("bbox" in f for f in faces):
+        boxes = np.array([f["bbox"] for f in faces], dtype=np.float32).reshape(-1, 4)
+    return decode_data_url(message["frame"]), boxes, landmarks
@@ -0,0 +1,335 @@
+"""
+Headless multi-stream CCTV ingestion.
+
+Each stream (video file, RTSP/HTTP URL or device index) has its own decode
+thread; sampled frames from every stream share one pool of detection workers
+and one face index. Run standalone from backend/:
+
+    python -m ml.ingest --config streams.json --gallery ./embeddings/uploaded_embeddings
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from ml.alert_system import alerts, send_alert
+from ml.detection import make_det_size
+from ml.face_index import FaceIndex
+from ml.motion import MotionGate
+from ml.tracking import FaceTracker
+
+LIVE_PREFIXES = ("rtsp://", "rtsps://", "http://", "https://", "udp://", "tcp://")
+
+
+@dataclass
+class StreamConfig:
+    name: str
+    source: str
+    # Frames per second to run detection on; 0 processes every frame
+    sample_fps: float = 5.0
+    enabled: bool = True
+    # Skip detection on static frames
+    motion_gate: bool = True
+    # RetinaFace input size: a multiple of 32, "adaptive", or None for the default
+    det_size: Optional[Union[int, str]] = None
+
+    @property
+    def capture_source(self) -> Union[int, str]:
+        return int(self.source) if str(self.source).isdigit() else self.source
+
+    @property
+    def is_live(self) -> bool:
+        return str(self.source).isdigit() or str(self.source).lower().startswith(LIVE_PREFIXES)
+
+
+@dataclass
+class StreamStats:
+    started: float = field(default_factory=time.monotonic)
+    frames_read: int = 0
+    frames_sampled: int = 0
+    frames_processed: int = 0
+    frames_dropped: int = 0
+    faces: int = 0
+    matches: int = 0
+    processing_ms: float = 0.0
+    error: Optional[str] = None
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        processed = max(self.frames_processed, 1)
+        return {
+            "frames_read": self.frames_read,
+            "frames_sampled": self.frames_sampled,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "faces": self.faces,
+            "matches": self.matches,
+            "read_fps": self.frames_read / elapsed,
+            "processed_fps": self.frames_processed / elapsed,
+            "avg_processing_ms": self.processing_ms / processed,
+            "error": self.error,
+        }
+
+
+def check_source(source: str, schemes: List[str], hosts: List[str], allow_local: bool):
+    """
+    Raise ValueError unless source is a URL with an allowed scheme and host,
+    or a local file / device index and allow_local. An empty hosts list
+    allows no network source at all; "*" allows any host.
+    """
+    parts = urlsplit(str(source))
+    if not parts.scheme or parts.scheme.lower() == "file" or len(parts.scheme) == 1:
+        # Plain path, file:// URL, device index or a Windows drive letter
+        if not allow_local:
+            raise ValueError("Local files and devices are not allowed as stream sources")
+        return
+    if parts.scheme.lower() not in schemes:
+        raise ValueError(f"Stream scheme '{parts.scheme}' not allowed, expected one of {schemes}")
+    if not hosts:
+        raise ValueError("Network stream sources are disabled (no STREAM_HOSTS configured)")
+    if "*" not in hosts and (parts.hostname or "").lower() not in hosts:
+        raise ValueError(f"Stream host '{parts.hostname}' is not allowed")
+
+
+def load_stream_configs(path: str) -> List[StreamConfig]:
+    """Read {"streams": [{"name", "source", "sample_fps"}, ...]} from a JSON file"""
+    with open(path) as f:
+        data = json.load(f)
+    return [StreamConfig(**entry) for entry in data.get("streams", [])]
+
+
+class StreamWorker:
+    """Decode thread for one stream; keeps at most one frame in flight"""
+
+    def __init__(self, config: StreamConfig, service: "IngestionService"):
+        self.config = config
+        self.service = service
+        self.stats = StreamStats()
+        self.tracker = FaceTracker()
+        self.gate = MotionGate() if config.motion_gate else None
+        self.det_size = make_det_size(
+            config.det_size if config.det_size is not None else service.det_size)
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(
+            target=self._run, name=f"stream-{config.name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.config.capture_source)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open source {self.config.source}")
+        return cap
+
+    def _frame_step(self, cap) -> int:
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        if self.config.sample_fps <= 0:
+            return 1
+        return max(1, round(source_fps / self.config.sample_fps))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                cap = self._open()
+            except Exception as e:
+                self.stats.error = str(e)
+                logger.error(f"[{self.config.name}] {e}")
+                if not self.config.is_live:
+                    return
+                self._stop.wait(5)
+                continue
+
+            self.stats.error = None
+            step = self._frame_step(cap)
+            index = 0
+            try:
+                while not self._stop.is_set():
+                    # grab() demuxes without decoding, so skipped frames are cheap
+                    if not cap.grab():
+                        break
+                    self.stats.frames_read += 1
+                    index += 1
+                    if index % step:
+                        continue
+
+                    if not self._idle.is_set():
+                        if self.config.is_live:
+                            # Live feeds drop rather than fall behind real time
+                            self.stats.frames_dropped += 1
+                            continue
+                        while not self._idle.wait(0.5) and not self._stop.is_set():
+                            pass
+
+                    ok, frame = cap.retrieve()
+                    if not ok:
+                        continue
+                    self.stats.frames_sampled += 1
+                    self._idle.clear()
+                    self.service.submit(self, frame)
+            finally:
+                cap.release()
+
+            if not self.config.is_live:
+                logger.info(f"[{self.config.name}] end of stream")
+                return
+            logger.warning(f"[{self.config.name}] stream lost, reconnecting")
+            self._stop.wait(1)
+
+    def process(self, frame: np.ndarray):
+        """Runs on the shared worker pool"""
+        start = time.perf_counter()
+        try:
+            detections = self.service.detection.process(
+                frame, self.tracker, self.gate, self.det_size)
+            self.stats.faces += len(detections)
+            if len(detections):
+                self.service.match(self, frame, detections)
+        except Exception as e:
+            logger.error(f"[{self.config.name}] processing error: {e}")
+        finally:
+            self.stats.frames_processed += 1
+            self.stats.processing_ms += (time.perf_counter() - start) * 1000
+            self._idle.set()
+
+
+class IngestionService:
+    """Runs many streams against one detection stage and one face index"""
+
+    def __init__(self, detection, face_index, workers: int = 4, threshold: float = 0.4,
+                 det_size=None):
+        self.detection = detection
+        self.face_index = face_index
+        self.threshold = threshold
+        # Detector input size for streams that do not set their own
+        self.det_size = det_size
+        self.streams: Dict[str, StreamWorker] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+
+    def add_stream(self, config: StreamConfig) -> StreamWorker:
+        with self._lock:
+            if config.name in self.streams:
+                raise ValueError(f"Stream '{config.name}' already exists")
+            worker = StreamWorker(config, self)
+            self.streams[config.name] = worker
+        if config.enabled:
+            worker.start()
+        logger.info(f"Stream '{config.name}' added ({config.source})")
+        return worker
+
+    def remove_stream(self, name: str) -> bool:
+        with self._lock:
+            worker = self.streams.pop(name, None)
+        if worker is None:
+            return False
+        worker.stop()
+        return True
+
+    def submit(self, worker: StreamWorker, frame: np.ndarray):
+        self._pool.submit(worker.process, frame)
+
+    def match(self, worker: StreamWorker, frame: np.ndarray, detections):
+        results = self.face_index.search(detections.embeddings, k=1)
+        for row, candidates in enumerate(results):
+            if not candidates:
+                continue
+            person_id, sim = candidates[0]
+            if detections.track_ids is not None:
+                sim = worker.tracker.observe(int(detections.track_ids[row]), sim, person_id)
+            if sim > self.threshold:
+                worker.stats.matches += 1
+                send_alert(sim, frame, person_id=person_id, location=worker.config.name)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {"source": w.config.source, "sample_fps": w.config.sample_fps,
+                   "running": w.running, **w.stats.snapshot(),
+                   "det_size": w.det_size.size() if hasattr(w.det_size, "size") else w.det_size,
+                   "motion": w.gate.stats() if w.gate else None}
+            for name, w in list(self.streams.items())
+        }
+
+    def stop(self):
+        for name in list(self.streams):
+            self.remove_stream(name)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_npy_gallery(directory: str) -> FaceIndex:
+    """Index every <name>.npy embedding in a directory"""
+    paths = sorted(glob.glob(os.path.join(directory, "*.npy")))
+    index = FaceIndex()
+    if paths:
+        ids = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+        index.build(ids, np.stack([np.load(p) for p in paths]))
+    return index
+
+
+def main():
+    from ml.batcher import EmbeddingBatcher
+    from ml.detection import DetectionStage
+    from ml.registry import registry
+
+    parser = argparse.ArgumentParser(description="Headless multi-stream face ingestion")
+    parser.add_argument("--config", required=True, help="JSON stream list")
+    parser.add_argument("--gallery", default="./embeddings/uploaded_embeddings",
+                        help="directory of <person>.npy embeddings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--detector", default="retinaface")
+    parser.add_argument("--threshold", type=float, default=0.4)
+    parser.add_argument("--det-size", default=None,
+                        help="detector input size or 'adaptive' for streams without one")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+
+    arcface = registry.get("arcface")
+    # Crops from all streams share recognition batches
+    batcher = EmbeddingBatcher(arcface.rec_model)
+    detection = DetectionStage(arcface, detector=args.detector, batcher=batcher)
+    service = IngestionService(detection, load_npy_gallery(args.gallery),
+                               workers=args.workers, threshold=args.threshold,
+                               det_size=args.det_size)
+    for config in load_stream_configs(args.config):
+        service.add_stream(config)
+
+    try:
+        while any(w.running for w in service.streams.values()):
+            time.sleep(args.report_every)
+            for name, s in service.stats().items():
+                print(f"📹 {name}: read {s['read_fps']:.1f} fps, processed "
+                      f"{s['processed_fps']:.1f} fps, dropped {s['frames_dropped']}, "
+                      f"faces {s['faces']}, matches {s['matches']}, "
+                      f"motion-skipped {(s['motion'] or {}).get('skip_ratio', 0):.0%}, "
+                      f"{s['avg_processing_ms']:.1f} ms/frame")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        alerts.close()
+        print("🛑 Ingestion stopped")
+
+
+if __name__ == "__main__":
+    main()
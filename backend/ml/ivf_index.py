@@ -0,0 +1,220 @@
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ml.face_index import normalize
+
+
+def spherical_kmeans(data: np.ndarray, k: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """k-means on the unit sphere; returns (k, D) normalized centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        # Re-seed empty clusters from random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Approximate 1:N face index (inverted file).
+    Embeddings are bucketed by their nearest of nlist k-means centroids and a
+    query only scans the nprobe closest buckets. Exposes the same
+    build/add/remove/search API as FaceIndex; until the index holds at least
+    nlist embeddings it is untrained and searches every row exactly.
+    """
+
+    def __init__(self, dim: int = 512, nlist: int = 1024, nprobe: int = 16,
+                 train_size: int = 100_000, n_iter: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._ids: List[Optional[str]] = []
+        self._rows = {}
+        self._free: List[int] = []
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_cache = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._rows
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign_rows(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            assign[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def _rebuild_lists(self):
+        self._lists = [[] for _ in range(self.nlist)]
+        for row in self._rows.values():
+            self._lists[self._assign[row]].append(row)
+        self._list_cache = {}
+
+    def train(self, vectors: np.ndarray):
+        """Fit centroids on (a sample of) normalized vectors"""
+        if len(vectors) > self.train_size:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[rng.choice(len(vectors), size=self.train_size, replace=False)]
+        self.centroids = spherical_kmeans(vectors, self.nlist, self.n_iter, self.seed)
+
+    def build(self, ids: Iterable[str], embeddings: np.ndarray, retrain: bool = True):
+        """
+        Replace the whole index, training centroids when there is enough data.
+        retrain=False keeps already trained (e.g. loaded) centroids.
+        """
+        ids = list(ids)
+        matrix = normalize(embeddings) if ids else np.empty(
+            (0, self.dim), dtype=np.float32)
+        with self._lock:
+            self._ids = ids
+            self._rows = {id: row for row, id in enumerate(ids)}
+            self._free = []
+            self._matrix = matrix
+            if retrain or not self.is_trained:
+                self.centroids = None
+                if len(ids) >= self.nlist:
+                    self.train(matrix)
+            if self.is_trained:
+                self._assign = self._assign_rows(matrix)
+                self._rebuild_lists()
+            else:
+                self._assign = np.zeros(len(ids), dtype=np.int32)
+        logger.info(
+            f"IVF index built: {len(ids)} embeddings, trained={self.is_trained}")
+
+    def add(self, id: str, embedding: np.ndarray):
+        """Insert or replace a single embedding"""
+        vector = normalize(embedding)[0]
+        with self._lock:
+            if id in self._rows:
+                self._remove(id)
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._ids)
+                if row == len(self._matrix):
+                    size = max(16, row * 2)
+                    grown = np.empty((size, self.dim), dtype=np.float32)
+                    grown[:row] = self._matrix[:row]
+                    assign = np.zeros(size, dtype=np.int32)
+                    assign[:row] = self._assign[:row]
+                    self._matrix, self._assign = grown, assign
+                self._ids.append(None)
+            self._matrix[row] = vector
+            self._ids[row] = id
+            self._rows[id] = row
+            if self.is_trained:
+                cell = int(np.argmax(self.centroids @ vector))
+                self._assign[row] = cell
+                self._lists[cell].append(row)
+                self._list_cache.pop(cell, None)
+
+    def get(self, id: str) -> Optional[np.ndarray]:
+        """Normalized embedding stored for id, or None"""
+        with self._lock:
+            row = self._rows.get(id)
+            return None if row is None else self._matrix[row].copy()
+
+    def _remove(self, id: str) -> bool:
+        row = self._rows.pop(id, None)
+        if row is None:
+            return False
+        self._ids[row] = None
+        self._free.append(row)
+        if self.is_trained:
+            cell = int(self._assign[row])
+            self._lists[cell].remove(row)
+            self._list_cache.pop(cell, None)
+        return True
+
+    def remove(self, id: str) -> bool:
+        with self._lock:
+            return self._remove(id)
+
+    def _cell_rows(self, cell: int) -> np.ndarray:
+        rows = self._list_cache.get(cell)
+        if rows is None:
+            rows = np.array(self._lists[cell], dtype=np.int64)
+            self._list_cache[cell] = rows
+        return rows
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        if not self.is_trained:
+            return np.array(sorted(self._rows.values()), dtype=np.int64)
+        cells = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self._cell_rows(int(c)) for c in cells])
+
+    def search(self, queries: np.ndarray, k: int = 5,
+               nprobe: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Approximate top-k cosine matches for each query row
+        Returns: one list of (id, similarity) per query, best first
+        """
+        queries = normalize(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        results = []
+        with self._lock:
+            for query in queries:
+                rows = self._candidates(query, nprobe)
+                if len(rows) == 0:
+                    results.append([])
+                    continue
+                scores = self._matrix[rows] @ query
+                top_k = min(k, len(rows))
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                top = top[np.argsort(-scores[top])]
+                results.append(
+                    [(self._ids[rows[i]], float(scores[i])) for i in top])
+        return results
+
+    def save(self, path: str):
+        """Persist vectors, ids and centroids to a .npz file"""
+        with self._lock:
+            rows = np.array(sorted(self._rows.values()), dtype=np.int64)
+            np.savez(
+                path,
+                ids=np.array([self._ids[r] for r in rows], dtype=str),
+                matrix=self._matrix[rows],
+                assign=self._assign[rows],
+                centroids=self.centroids if self.is_trained else np.empty((0, self.dim), np.float32),
+                params=np.array([self.nlist, self.nprobe, self.train_size, self.n_iter, self.seed]),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        nlist, nprobe, train_size, n_iter, seed = (int(v) for v in data["params"])
+        matrix = data["matrix"]
+        index = cls(matrix.shape[1], nlist, nprobe, train_size, n_iter, seed)
+        index._ids = data["ids"].tolist()
+        index._rows = {id: row for row, id in enumerate(index._ids)}
+        index._matrix = matrix
+        index._assign = data["assign"].astype(np.int32)
+        if len(data["centroids"]):
+            index.centroids = data["centroids"]
+            index._rebuild_lists()
+        return index
@@ -0,0 +1,98 @@
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class MotionResult(NamedTuple):
+    # False when the frame is static and detection can be skipped
+    active: bool
+    # x1, y1, x2, y2 region (full-resolution pixels) to limit detection to,
+    # or None to detect on the whole frame
+    roi: Optional[Tuple[int, int, int, int]]
+    # Fraction of the downscaled frame that changed
+    motion: float
+
+
+class MotionGate:
+    """
+    Cheap pre-filter in front of face detection.
+    Frames are downscaled to a small grayscale image and differenced against a
+    running-average background. Static frames are skipped and, when motion is
+    confined to a small area, detection is limited to that region; either
+    way a full-frame detection is forced every max_skip frames.
+    """
+
+    def __init__(self, width: int = 160, pixel_threshold: int = 25,
+                 min_motion: float = 0.002, alpha: float = 0.05, max_skip: int = 10,
+                 roi_max_fraction: float = 0.5, margin: float = 0.2):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_motion = min_motion
+        self.alpha = alpha
+        self.max_skip = max_skip
+        self.roi_max_fraction = roi_max_fraction
+        self.margin = margin
+        self.frames = 0
+        self.skipped = 0
+        self.roi_frames = 0
+        self._background: Optional[np.ndarray] = None
+        self._since_full = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "skipped": self.skipped,
+                "roi_frames": self.roi_frames, "skip_ratio": self.skip_ratio}
+
+    def _small_gray(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _roi(self, mask: np.ndarray, frame_shape) -> Optional[Tuple[int, int, int, int]]:
+        x, y, w, h = cv2.boundingRect(mask)
+        if w * h > self.roi_max_fraction * mask.size:
+            return None
+        scale = frame_shape[1] / mask.shape[1]
+        pad_x, pad_y = w * self.margin, h * self.margin
+        x1 = int(max(0, (x - pad_x) * scale))
+        y1 = int(max(0, (y - pad_y) * scale))
+        x2 = int(min(frame_shape[1], (x + w + pad_x) * scale))
+        y2 = int(min(frame_shape[0], (y + h + pad_y) * scale))
+        return x1, y1, x2, y2
+
+    def check(self, frame: np.ndarray) -> MotionResult:
+        self.frames += 1
+        gray = self._small_gray(frame)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._since_full = 0
+            return MotionResult(True, None, 1.0)
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, None, iterations=2)
+        cv2.accumulateWeighted(gray, self._background, self.alpha)
+        motion = cv2.countNonZero(mask) / mask.size
+
+        # Frames since the last full-frame pass, with or without motion, so a
+        # still face outside a moving region is still found every max_skip frames
+        self._since_full += 1
+        full_due = self._since_full >= self.max_skip
+        if motion < self.min_motion:
+            if not full_due:
+                self.skipped += 1
+                return MotionResult(False, None, motion)
+            self._since_full = 0
+            return MotionResult(True, None, motion)
+
+        roi = None if full_due else self._roi(mask, frame.shape)
+        if roi is None:
+            self._since_full = 0
+        else:
+            self.roi_frames += 1
+        return MotionResult(True, roi, motion)
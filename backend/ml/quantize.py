@@ -0,0 +1,138 @@
+"""
+Dynamic int8 quantization of the detection and recognition models.
+
+Writes <model>.int8.onnx for each selected model into --out, then checks
+the int8 models against fp32 on a validation set of photos: detection
+recall (IoU >= 0.5 against the fp32 boxes) and the cosine similarity of
+int8 vs fp32 embeddings of the same aligned faces. Exits non-zero when
+either falls below its threshold. Set ORT_QUANTIZED_DIR to --out to serve
+the int8 models.
+
+Run from backend/:
+    python -m ml.quantize --out ./models/quantized --images ./data/uploaded_photos
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from loguru import logger
+
+from ml.face_index import normalize
+from ml.frames import load_images
+from ml.tracking import iou_matrix
+
+WEIGHT_TYPES = ("uint8", "int8")
+
+
+def quantize_model(model_file: str, out_dir: str, weight_type: str = "uint8",
+                   per_channel: bool = False) -> str:
+    """Dynamic (weights int8, activations quantized at run time) quantization"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from models.arcface.index import quantized_path
+
+    os.makedirs(out_dir, exist_ok=True)
+    out = quantized_path(model_file, out_dir)
+    quantize_dynamic(model_file, out, per_channel=per_channel,
+                     weight_type=QuantType.QUInt8 if weight_type == "uint8" else QuantType.QInt8)
+    logger.info(f"Quantized {model_file} -> {out} "
+                f"({os.path.getsize(model_file) / 1e6:.1f} MB -> {os.path.getsize(out) / 1e6:.1f} MB)")
+    return out
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def validate(fp32, int8, images) -> dict:
+    """
+    Compare an int8 ArcFaceModel with the fp32 one. Embeddings are taken from
+    the fp32 landmarks for both, so the cosine isolates recognition error.
+    """
+    faces = found = 0
+    cosines = []
+    ms = {"fp32_detect": 0.0, "int8_detect": 0.0, "fp32_embed": 0.0, "int8_embed": 0.0}
+    for img in images:
+        (boxes, landmarks), t = _timed(fp32.detect, img)
+        ms["fp32_detect"] += t
+        (int8_boxes, _), t = _timed(int8.detect, img)
+        ms["int8_detect"] += t
+        if len(boxes) == 0:
+            continue
+        faces += len(boxes)
+        if len(int8_boxes):
+            found += int((iou_matrix(boxes[:, :4], int8_boxes[:, :4]).max(axis=1) >= 0.5).sum())
+
+        reference, t = _timed(fp32.get_embeddings, img, landmarks)
+        ms["fp32_embed"] += t
+        quantized, t = _timed(int8.get_embeddings, img, landmarks)
+        ms["int8_embed"] += t
+        cosines.extend((normalize(reference) * normalize(quantized)).sum(axis=1).tolist())
+
+    cosines = np.array(cosines)
+    return {
+        "images": len(images),
+        "faces": faces,
+        "detection_recall": found / faces if faces else None,
+        "cosine_mean": float(cosines.mean()) if len(cosines) else None,
+        "cosine_min": float(cosines.min()) if len(cosines) else None,
+        **{f"{key}_ms": total / max(len(images), 1) for key, total in ms.items()},
+    }
+
+
+def main():
+    from models.arcface.index import ArcFaceModel
+
+    parser = argparse.ArgumentParser(description="Quantize the face models to int8 and validate them")
+    parser.add_argument("--out", default="./models/quantized", help="directory for .int8.onnx files")
+    parser.add_argument("--images", default="./data/uploaded_photos", help="validation photos")
+    parser.add_argument("--models", nargs="+", choices=("detection", "recognition"),
+                        default=["detection", "recognition"])
+    parser.add_argument("--weight-type", choices=WEIGHT_TYPES, default="uint8")
+    parser.add_argument("--per-channel", action="store_true")
+    parser.add_argument("--skip-quantize", action="store_true",
+                        help="only validate the models already in --out")
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="required mean int8/fp32 embedding cosine")
+    parser.add_argument("--min-recall", type=float, default=0.98,
+                        help="required int8 detection recall against fp32")
+    args = parser.parse_args()
+
+    fp32 = ArcFaceModel()
+    if not args.skip_quantize:
+        for task in args.models:
+            quantize_model(fp32.app.models[task].model_file, args.out,
+                           args.weight_type, args.per_channel)
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    int8 = ArcFaceModel(quantized_dir=args.out)
+    if not int8.quantized:
+        raise SystemExit(f"No quantized models found in {args.out}")
+
+    r = validate(fp32, int8, images)
+    print(f"📊 {r['images']} images, {r['faces']} faces, int8 models: {', '.join(int8.quantized)}")
+    print(f"   detect  fp32 {r['fp32_detect_ms']:7.1f} ms  int8 {r['int8_detect_ms']:7.1f} ms  "
+          f"recall {r['detection_recall'] if r['detection_recall'] is not None else float('nan'):.3f}")
+    print(f"   embed   fp32 {r['fp32_embed_ms']:7.1f} ms  int8 {r['int8_embed_ms']:7.1f} ms  "
+          f"cosine mean {r['cosine_mean'] or float('nan'):.4f} min {r['cosine_min'] or float('nan'):.4f}")
+
+    if not r["faces"]:
+        raise SystemExit("No faces found by the fp32 detector; cannot validate")
+    failed = []
+    if r["detection_recall"] < args.min_recall:
+        failed.append(f"detection recall {r['detection_recall']:.3f} < {args.min_recall}")
+    if r["cosine_mean"] < args.min_cosine:
+        failed.append(f"mean cosine {r['cosine_mean']:.4f} < {args.min_cosine}")
+    if failed:
+        print("❌ int8 models rejected: " + "; ".join(failed))
+        sys.exit(1)
+    print(f"✅ int8 models pass; set ORT_QUANTIZED_DIR={args.out} to use them")
+
+
+if __name__ == "__main__":
+    main()
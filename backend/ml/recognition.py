@@ -1,8 +1,14 @@
 import numpy as np
-from typing import Optional, Tuple
-import cv2
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
 from loguru import logger
 
+from ml.face_index import normalize, top_k
+
+# Lower bounds of the "high" and "medium" confidence levels
+CONFIDENCE_LEVELS = ((0.7, "high"), (0.5, "medium"))
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """Calculate cosine similarity between two vectors"""
@@ -38,9 +44,101 @@ def compare_faces(embedding1: np.ndarray, embedding2: np.ndarray, threshold: flo
 
 def get_confidence_level(similarity: float) -> str:
     """Get confidence level based on similarity score"""
-    if similarity >= 0.7:
-        return "high"
-    elif similarity >= 0.5:
-        return "medium"
-    else:
-        return "low"
+    for bound, level in CONFIDENCE_LEVELS:
+        if similarity >= bound:
+            return level
+    return "low"
+
+
+def confidence_levels(similarities: np.ndarray) -> np.ndarray:
+    """Vectorized get_confidence_level"""
+    similarities = np.asarray(similarities)
+    conditions = [similarities >= bound for bound, _ in CONFIDENCE_LEVELS]
+    return np.select(conditions, [level for _, level in CONFIDENCE_LEVELS], default="low")
+
+
+# Batched API: any index with the FaceIndex search() API (FaceIndex,
+# IVFIndex, SharedFaceIndex, EmbeddingMatrix) scores every query against the
+# gallery with one matrix product.
+
+class EmbeddingMatrix:
+    """
+    Read-only gallery in reduced precision, with the FaceIndex search API.
+    float16 and int8 storage halve / quarter the memory (int8 rows are scaled
+    by 127 and rescaled to unit norm when scored); scores are computed in
+    float32 chunks so BLAS is still used for the product.
+    """
+
+    def __init__(self, ids: Iterable[str], embeddings: np.ndarray, dtype: str = "float32",
+                 chunk: int = 65536):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+        self.ids = list(ids)
+        self.dtype = dtype
+        self.chunk = chunk
+        matrix = normalize(embeddings)
+        self.row_scale = None
+        if dtype == "int8":
+            self.matrix = np.round(matrix * 127).astype(np.int8)
+            # Undo the quantized rows' norm so self-similarity stays 1
+            self.row_scale = 1 / np.maximum(
+                np.linalg.norm(self.matrix.astype(np.float32), axis=1), 1e-6)
+        else:
+            self.matrix = matrix.astype(dtype)
+
+    @classmethod
+    def from_index(cls, index, dtype: str = "float16") -> "EmbeddingMatrix":
+        """Reduced-precision copy of a FaceIndex"""
+        ids, matrix = index.export()
+        return cls(ids, matrix, dtype)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """(Q, G) cosine similarities"""
+        queries = normalize(queries)
+        if self.dtype == "float32":
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), self.chunk):
+            block = self.matrix[start:start + self.chunk].astype(np.float32)
+            scores[:, start:start + self.chunk] = queries @ block.T
+        if self.row_scale is not None:
+            scores *= self.row_scale
+        return scores
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        return top_k(self.scores(queries), self.ids, k)
+
+
+@dataclass
+class BatchMatches:
+    """Top-k gallery entries per query, best first; all arrays are (Q, k)"""
+    ids: np.ndarray
+    similarities: np.ndarray
+    matched: np.ndarray
+    confidence: np.ndarray
+
+
+def match_batch(queries: np.ndarray, index, threshold: float = 0.4, k: int = 1) -> BatchMatches:
+    """
+    Match every query against the gallery in one call
+    index: a FaceIndex (or any index with its search API); wrap it in
+    EmbeddingMatrix.from_index() to search in float16/int8.
+    Queries with fewer than k matches are padded with None ids and NaN.
+    """
+    results = index.search(queries, k)
+    ids = np.full((len(results), k), None, dtype=object)
+    similarities = np.full((len(results), k), np.nan, dtype=np.float32)
+    for row, matches in enumerate(results):
+        for col, (id, similarity) in enumerate(matches[:k]):
+            ids[row, col] = id
+            similarities[row, col] = similarity
+    return BatchMatches(ids=ids, similarities=similarities,
+                        matched=similarities > threshold,
+                        confidence=confidence_levels(similarities))
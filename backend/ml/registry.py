@@ -0,0 +1,131 @@
+"""
+Process-wide model registry.
+
+Every model is built at most once per process: on first use, or up front by
+warm_up(), which also runs a dummy inference so ONNX Runtime / TensorFlow
+initialisation is not paid by the first real request. Heavy libraries can be
+imported without building any session (import_modules), e.g. in a gunicorn
+master before workers fork.
+"""
+import importlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Tuple[Callable, Optional[Callable], Tuple[str, ...]]] = {}
+        self._instances = {}
+        self._warm = set()
+        # Re-entrant: a factory may get() the models it depends on
+        self._lock = threading.RLock()
+        self.load_ms: Dict[str, float] = {}
+        self.warmup_ms: Dict[str, float] = {}
+        # Intra-op threads per inference session when this process is pinned
+        # to a CPU share (PIN_WORKERS); None uses ORT_INTRA_OP_THREADS
+        self.threads: Optional[int] = None
+
+    def register(self, name: str, factory: Callable, warmup: Optional[Callable] = None,
+                 modules: Iterable[str] = ()):
+        """factory() builds the model, warmup(model) runs a throwaway inference"""
+        self._factories[name] = (factory, warmup, tuple(modules))
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise ValueError(f"Unknown model '{name}'")
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name][0]()
+                self.load_ms[name] = (time.perf_counter() - start) * 1000
+                logger.info(f"Loaded model '{name}' in {self.load_ms[name]:.0f} ms")
+            return self._instances[name]
+
+    def lazy(self, name: str) -> Callable:
+        """Zero-argument getter, for components that resolve the model on first use"""
+        return lambda: self.get(name)
+
+    def loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def import_modules(self, names: Optional[Iterable[str]] = None):
+        """Import the libraries behind models without loading any weights"""
+        for name in names or list(self._factories):
+            for module in self._factories[name][2]:
+                importlib.import_module(module)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None):
+        """Load models and run each one once"""
+        for name in names or list(self._factories):
+            model = self.get(name)
+            warmup = self._factories[name][1]
+            if warmup is not None and name not in self._warm:
+                start = time.perf_counter()
+                warmup(model)
+                self.warmup_ms[name] = (time.perf_counter() - start) * 1000
+                logger.info(f"Warmed up model '{name}' in {self.warmup_ms[name]:.0f} ms")
+            self._warm.add(name)
+
+    def is_warm(self, names: Iterable[str]) -> bool:
+        return all(name in self._warm for name in names)
+
+    def status(self) -> dict:
+        return {
+            name: {"loaded": name in self._instances, "warm": name in self._warm,
+                   "load_ms": self.load_ms.get(name), "warmup_ms": self.warmup_ms.get(name)}
+            for name in self._factories
+        }
+
+
+def _arcface():
+    from app.core.config import (
+        ORT_CPU_ARENA,
+        ORT_EXECUTION_MODE,
+        ORT_GRAPH_OPTIMIZATION,
+        ORT_INTER_OP_THREADS,
+        ORT_INTRA_OP_THREADS,
+        ORT_MEM_PATTERN,
+        ORT_QUANTIZED_DIR,
+        ORT_REC_INTRA_OP_THREADS,
+    )
+    from models.arcface.index import ArcFaceModel, SessionConfig
+
+    session = SessionConfig(intra_op_threads=ORT_INTRA_OP_THREADS,
+                            recognition_intra_op_threads=ORT_REC_INTRA_OP_THREADS,
+                            inter_op_threads=ORT_INTER_OP_THREADS,
+                            graph_optimization=ORT_GRAPH_OPTIMIZATION,
+                            execution_mode=ORT_EXECUTION_MODE,
+                            cpu_arena=ORT_CPU_ARENA, mem_pattern=ORT_MEM_PATTERN)
+    arcface = ArcFaceModel(ctx_id=0, intra_op_threads=registry.threads, session=session,
+                           quantized_dir=ORT_QUANTIZED_DIR or None)
+    if arcface.quantized:
+        logger.info(f"Using int8 models for {', '.join(arcface.quantized)}")
+    return arcface
+
+
+def _warm_arcface(arcface):
+    arcface.detect(np.zeros((640, 640, 3), dtype=np.uint8))
+    size = arcface.rec_model.input_size[0]
+    arcface.rec_model.get_feat([np.zeros((size, size, 3), dtype=np.uint8)])
+
+
+def _mtcnn():
+    from mtcnn import MTCNN
+    return MTCNN()
+
+
+def _warm_mtcnn(mtcnn):
+    mtcnn.detect_faces(np.zeros((160, 160, 3), dtype=np.uint8))
+
+
+registry = ModelRegistry()
+registry.register("arcface", _arcface, _warm_arcface,
+                  modules=("onnxruntime", "insightface.app", "models.arcface.index"))
+registry.register("mtcnn", _mtcnn, _warm_mtcnn, modules=("tensorflow", "mtcnn"))
@@ -0,0 +1,247 @@
+"""
+Face gallery shared by every worker process through memory-mapped files.
+
+One process (the writer) publishes snapshots of the whole gallery; every
+process maps the latest snapshot read-only, so the pages live once in the
+OS page cache however many workers there are. A snapshot is three .npy
+files sorted by id (normalized float32 embeddings, ids, names) plus a
+current.json pointer that is replaced atomically.
+"""
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ml.face_index import FaceIndex, normalize, top_k
+
+MANIFEST = "current.json"
+# Older snapshots kept around for readers that have not switched yet
+KEEP_SNAPSHOTS = 2
+
+_writer_lock_fd = None
+
+
+def acquire_writer_lock(directory: str) -> bool:
+    """Non-blocking; the lock is held until this process exits"""
+    global _writer_lock_fd
+    if _writer_lock_fd is not None:
+        return True
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, "writer.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _writer_lock_fd = fd
+    return True
+
+
+def _save_npy(path: str, array: np.ndarray):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def write_snapshot(directory: str, ids: List[str], names: List[str],
+                   embeddings: np.ndarray) -> int:
+    """Publish a new snapshot; returns its version"""
+    os.makedirs(directory, exist_ok=True)
+    version = time.time_ns()
+    order = np.argsort(np.array(ids, dtype=str)) if ids else np.empty(0, dtype=np.int64)
+    dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+    matrix = normalize(embeddings)[order] if ids else np.empty((0, dim), dtype=np.float32)
+    prefix = os.path.join(directory, str(version))
+    _save_npy(f"{prefix}.emb.npy", matrix)
+    _save_npy(f"{prefix}.ids.npy", np.array(ids, dtype=str)[order])
+    _save_npy(f"{prefix}.names.npy", np.array(names, dtype=str)[order])
+
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"version": version, "count": len(ids)}, f)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+    # Unlinking is safe for readers that still have old files mapped
+    versions = sorted({int(os.path.basename(p).split(".")[0])
+                       for p in glob.glob(os.path.join(directory, "*.emb.npy"))})
+    for old in versions[:-KEEP_SNAPSHOTS]:
+        for path in glob.glob(os.path.join(directory, f"{old}.*.npy")):
+            os.remove(path)
+    return version
+
+
+class _Snapshot:
+    def __init__(self, directory: str, version: Optional[int], dim: int):
+        self.version = version
+        if version is None:
+            self.matrix = np.empty((0, dim), dtype=np.float32)
+            self.ids = np.empty(0, dtype=str)
+            self.names = np.empty(0, dtype=str)
+            return
+        prefix = os.path.join(directory, str(version))
+        self.matrix = np.load(f"{prefix}.emb.npy", mmap_mode="r")
+        self.ids = np.load(f"{prefix}.ids.npy", mmap_mode="r")
+        self.names = np.load(f"{prefix}.names.npy", mmap_mode="r")
+
+    def row(self, id: str) -> Optional[int]:
+        row = int(np.searchsorted(self.ids, id))
+        if row < len(self.ids) and self.ids[row] == id:
+            return row
+        return None
+
+
+class SharedNames:
+    """dict-like id -> name view over the snapshot plus local changes"""
+
+    def __init__(self, index: "SharedFaceIndex"):
+        self._index = index
+
+    def get(self, id: str, default=None):
+        if id in self._index._overlay_names:
+            return self._index._overlay_names[id]
+        if id in self._index._hidden:
+            return default
+        snapshot = self._index.snapshot()
+        row = snapshot.row(id)
+        return default if row is None else str(snapshot.names[row])
+
+    def __setitem__(self, id: str, name: str):
+        self._index._overlay_names[id] = name
+
+    def pop(self, id: str, default=None):
+        return self._index._overlay_names.pop(id, default)
+
+    def __contains__(self, id: str) -> bool:
+        return self.get(id) is not None
+
+
+class SharedFaceIndex:
+    """
+    Read side of the shared gallery, with the FaceIndex search API.
+    Embeddings added or removed by this process are kept in a small local
+    overlay until a snapshot containing the change is published.
+    """
+
+    def __init__(self, directory: str, dim: int = 512, check_seconds: float = 1.0):
+        self.directory = directory
+        self.dim = dim
+        self.check_seconds = check_seconds
+        self._snapshot = _Snapshot(directory, None, dim)
+        self._overlay = FaceIndex(dim)
+        self._overlay_ids = set()
+        self._overlay_names = {}
+        self._hidden = set()
+        self._checked = 0.0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.names = SharedNames(self)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Map the latest published snapshot; cheap (one stat) when unchanged"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_seconds:
+            return False
+        self._checked = now
+        manifest = os.path.join(self.directory, MANIFEST)
+        try:
+            mtime = os.stat(manifest).st_mtime_ns
+            if mtime == self._mtime and not force:
+                return False
+            with open(manifest) as f:
+                version = json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            return False
+        if version == self._snapshot.version:
+            self._mtime = mtime
+            return False
+
+        snapshot = _Snapshot(self.directory, version, self.dim)
+        with self._lock:
+            self._snapshot = snapshot
+            self._mtime = mtime
+            # Local changes the writer has now published
+            for id in [id for id in self._overlay_ids if snapshot.row(id) is not None]:
+                self._overlay.remove(id)
+                self._overlay_ids.discard(id)
+                self._overlay_names.pop(id, None)
+            self._hidden = {id for id in self._hidden if snapshot.row(id) is not None}
+        return True
+
+    def snapshot(self) -> _Snapshot:
+        self.refresh()
+        return self._snapshot
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._snapshot.version
+
+    def __len__(self) -> int:
+        snapshot = self.snapshot()
+        with self._lock:
+            # Overlay entries that replace a snapshot row are counted once
+            replaced = sum(1 for id in self._overlay_ids
+                           if id not in self._hidden and snapshot.row(id) is not None)
+            return len(snapshot.ids) + len(self._overlay) - len(self._hidden) - replaced
+
+    def __contains__(self, id: str) -> bool:
+        return self.get(id) is not None
+
+    def build(self, ids: Iterable[str], embeddings: np.ndarray,
+              names: Optional[Iterable[str]] = None):
+        """Replace the whole gallery by publishing a snapshot of it"""
+        ids = list(ids)
+        names = list(names) if names is not None else [self.names.get(id, "") for id in ids]
+        write_snapshot(self.directory, ids, names, np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            self._overlay = FaceIndex(self.dim)
+            self._overlay_ids.clear()
+            self._overlay_names.clear()
+            self._hidden.clear()
+        self.refresh(force=True)
+
+    def add(self, id: str, embedding: np.ndarray):
+        with self._lock:
+            self._overlay.add(id, embedding)
+            self._overlay_ids.add(id)
+            self._hidden.discard(id)
+
+    def remove(self, id: str) -> bool:
+        with self._lock:
+            removed = self._overlay.remove(id)
+            self._overlay_ids.discard(id)
+            if self._snapshot.row(id) is not None:
+                self._hidden.add(id)
+                removed = True
+            return removed
+
+    def get(self, id: str) -> Optional[np.ndarray]:
+        embedding = self._overlay.get(id)
+        if embedding is not None or id in self._hidden:
+            return embedding
+        snapshot = self.snapshot()
+        row = snapshot.row(id)
+        return None if row is None else np.array(snapshot.matrix[row])
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Top-k over the mapped snapshot merged with the local overlay"""
+        queries = normalize(queries)
+        snapshot = self.snapshot()
+        with self._lock:
+            hidden = self._hidden | self._overlay_ids
+        # Ask for extra rows so hidden/overridden ids cannot push results out
+        shared = top_k(queries @ snapshot.matrix.T, snapshot.ids, k + len(hidden))
+        local = self._overlay.search(queries, k) if len(self._overlay) else [[]] * len(queries)
+
+        results = []
+        for from_shared, from_local in zip(shared, local):
+            merged = [(id, s) for id, s in from_shared if id not in hidden] + from_local
+            merged.sort(key=lambda item: -item[1])
+            results.append(merged[:k])
+        return results
@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from itertools import count
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) x1, y1, x2, y2 boxes"""
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+@dataclass
+class Track:
+    id: int
+    box: np.ndarray
+    embedding: Optional[np.ndarray] = None
+    similarity: Optional[float] = None
+    # Person the smoothed similarity refers to
+    person_id: Optional[str] = None
+    since_recognition: int = 0
+    misses: int = 0
+
+
+class FaceTracker:
+    """
+    IoU tracker that decides which faces need a fresh ArcFace embedding.
+    A track is re-recognised when it is new, every recheck_interval frames,
+    or while its smoothed similarity sits in the ambiguous [low, high) band;
+    otherwise its last embedding is reused.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 5,
+                 recheck_interval: int = 10, low: float = 0.25, high: float = 0.5,
+                 smoothing: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.recheck_interval = recheck_interval
+        self.low = low
+        self.high = high
+        self.smoothing = smoothing
+        self.tracks: List[Track] = []
+        self._ids = count(1)
+
+    def _associate(self, boxes: np.ndarray):
+        if not self.tracks or len(boxes) == 0:
+            return {}
+        iou = iou_matrix(np.stack([t.box for t in self.tracks]), boxes)
+        pairs = {}
+        used_boxes = set()
+        # Greedy: best overlaps first
+        for flat in np.argsort(-iou, axis=None):
+            t, b = (int(i) for i in np.unravel_index(flat, iou.shape))
+            if iou[t, b] < self.iou_threshold:
+                break
+            if t in pairs or b in used_boxes:
+                continue
+            pairs[t] = b
+            used_boxes.add(b)
+        return pairs
+
+    def update(self, boxes: np.ndarray) -> Tuple[List[Track], np.ndarray]:
+        """
+        Assign detections to tracks
+        Returns: the track for each box and a mask of boxes needing recognition
+        """
+        pairs = self._associate(boxes)
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        alive = []
+        for t, track in enumerate(self.tracks):
+            if t in pairs:
+                b = pairs[t]
+                track.box = boxes[b]
+                track.misses = 0
+                track.since_recognition += 1
+                assigned[b] = track
+                alive.append(track)
+            else:
+                track.misses += 1
+                if track.misses <= self.max_misses:
+                    alive.append(track)
+
+        for b, track in enumerate(assigned):
+            if track is None:
+                track = Track(id=next(self._ids), box=boxes[b])
+                assigned[b] = track
+                alive.append(track)
+        self.tracks = alive
+
+        needs = np.array([self._needs_recognition(t) for t in assigned], dtype=bool)
+        return assigned, needs
+
+    def _needs_recognition(self, track: Track) -> bool:
+        if track.embedding is None or track.since_recognition >= self.recheck_interval:
+            return True
+        return track.similarity is not None and self.low <= track.similarity < self.high
+
+    def set_embedding(self, track: Track, embedding: np.ndarray):
+        track.embedding = embedding
+        track.since_recognition = 0
+
+    def observe(self, track_id: int, similarity: float, person_id: Optional[str] = None) -> float:
+        """
+        Fold a new similarity into the track's running average. The average
+        is per identity: when the best match changes to another person it
+        restarts, so one person's score never carries over to another.
+        """
+        for track in self.tracks:
+            if track.id == track_id:
+                if track.similarity is None or track.person_id != person_id:
+                    track.similarity = similarity
+                    track.person_id = person_id
+                else:
+                    track.similarity = (self.smoothing * similarity
+                                        + (1 - self.smoothing) * track.similarity)
+                return track.similarity
+        return similarity
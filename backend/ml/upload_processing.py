@@ -1,5 +1,5 @@
 
-from backend.ml.embeddings import process_uploaded_photo
+from ml.embeddings import process_uploaded_photo
 if __name__ == "__main__":
     uploaded_photo_path = "./data/uploaded_photos/profile.jpg"
     process_uploaded_photo(uploaded_photo_path, "person1")
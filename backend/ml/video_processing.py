@@ -1,24 +1,41 @@
-from backend.ml.alert_system import send_alert  # or simple print/log
-from backend.ml.recognition import cosine_similarity
-from models.arcface.index import ArcFaceModel
+from ml.alert_system import alerts, send_alert
+from ml.detection import DetectionStage, make_det_size
+from ml.motion import MotionGate
+from ml.face_index import normalize
+from ml.tracking import FaceTracker
 import cv2
 import numpy as np
+import os
 import sys
+import time
 sys.path.append('.')
 
 
-def run_video_detection():
-    # Load ArcFace model
-    arcface = ArcFaceModel(ctx_id=-1)
+def run_video_detection(source=0, embedding_path="./embeddings/uploaded_embeddings/person1.npy",
+                        display=True, max_frames=None, det_size=None, on_frame=None):
+    """
+    Single-stream detection loop; source is a device index, file or URL.
+    display=False runs headless (see ml.ingest for many streams at once).
+    on_frame(detections, elapsed_ms) is called after each processed frame.
+    """
+    # Uses the process-wide ArcFace model from ml.registry
+    detection = DetectionStage()
+    # Fixed size, or "adaptive" to shrink the detector input for large faces
+    det_size = make_det_size(det_size)
+    # Stable faces reuse their embedding instead of re-running ArcFace
+    tracker = FaceTracker()
+    # Static frames skip detection entirely
+    gate = MotionGate()
 
     # Load uploaded-photo embeddings
-    uploaded_embedding = np.load(
-        "./embeddings/uploaded_embeddings/person1.npy")
-    print("✅ Loaded facial embedding from profile1.jpg")
+    uploaded_embedding = np.load(embedding_path)
+    target = normalize(uploaded_embedding)[0]
+    person_id = os.path.splitext(os.path.basename(embedding_path))[0]
+    print(f"✅ Loaded facial embedding from {embedding_path}")
     print("🎥 Starting video detection...")
 
     # Open video feed (0 = default webcam, or path to CCTV/video file)
-    cap = cv2.VideoCapture(0)
+    cap = cv2.VideoCapture(source)
 
     threshold = 0.40  # similarity threshold
     frame_count = 0
@@ -29,12 +46,21 @@ def run_video_detection():
             break
 
         frame_count += 1
+        if max_frames is not None and frame_count > max_frames:
+            break
 
         # Detect faces and get embeddings
-        face_embedding = arcface.get_embedding_from_frame(frame)
+        frame_start = time.perf_counter()
+        detections = detection.process(frame, tracker, gate, det_size)
 
-        if face_embedding is not None:
-            sim = cosine_similarity(uploaded_embedding, face_embedding)
+        if detections.skipped:
+            pass  # static frame, nothing new to match
+        elif len(detections) > 0:
+            # Every face against the target at once; keep the closest
+            sims = normalize(detections.embeddings) @ target
+            sims = [tracker.observe(int(track_id), float(s))
+                    for track_id, s in zip(detections.track_ids, sims)]
+            sim = max(sims)
 
             # Show similarity score every 30 frames (about 1 second)
             if frame_count % 30 == 0:
@@ -42,22 +68,40 @@ def run_video_detection():
 
             if sim > threshold:
                 print(f"🚨 ALERT! MATCH FOUND! Similarity: {sim:.3f}")
-                send_alert(sim, frame)  # log or notify match
+                # Queued and de-duplicated; encoding happens off this loop
+                send_alert(sim, frame, person_id=person_id, location=str(source))
         else:
             # Show when no face is detected every 30 frames
             if frame_count % 30 == 0:
                 print("❌ No face detected in frame")
 
+        if on_frame is not None:
+            on_frame(detections, (time.perf_counter() - frame_start) * 1000)
+
         # Optional: display video with bounding boxes
-        cv2.imshow("Video Feed", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+        if display:
+            cv2.imshow("Video Feed", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
     cap.release()
-    cv2.destroyAllWindows()
+    alerts.flush()
+    if display:
+        cv2.destroyAllWindows()
     print("🛑 Video detection stopped")
 
 
 # Run directly if this file is executed
 if __name__ == "__main__":
-    run_video_detection()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="0", help="device index, video file or RTSP URL")
+    parser.add_argument("--embedding", default="./embeddings/uploaded_embeddings/person1.npy")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--det-size", default=None, help="detector input size or 'adaptive'")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    run_video_detection(source, args.embedding, display=not args.headless,
+                        det_size=args.det_size)
@@ -1,24 +1,185 @@
+import os
+from dataclasses import dataclass, replace
+from typing import Optional
+
 import cv2
 import numpy as np
 import insightface
+import onnxruntime
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
+
+
+GRAPH_OPTIMIZATION = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODE = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+@dataclass(frozen=True)
+class SessionConfig:
+    """ONNX Runtime options for every model session; defaults match the library's"""
+    intra_op_threads: int = 0
+    # Recognition session only; None uses intra_op_threads
+    recognition_intra_op_threads: Optional[int] = None
+    inter_op_threads: int = 0
+    graph_optimization: str = "all"
+    execution_mode: str = "sequential"
+    cpu_arena: bool = True
+    mem_pattern: bool = True
+
+    def __post_init__(self):
+        if self.graph_optimization not in GRAPH_OPTIMIZATION:
+            raise ValueError(f"Unknown graph optimization level '{self.graph_optimization}', "
+                             f"expected one of {', '.join(GRAPH_OPTIMIZATION)}")
+        if self.execution_mode not in EXECUTION_MODE:
+            raise ValueError(f"Unknown execution mode '{self.execution_mode}', "
+                             f"expected sequential or parallel")
+
+    def options(self, task: Optional[str] = None) -> onnxruntime.SessionOptions:
+        """Options for the session of one FaceAnalysis task ('detection', 'recognition')"""
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        if task == "recognition" and self.recognition_intra_op_threads is not None:
+            options.intra_op_num_threads = self.recognition_intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.graph_optimization_level = GRAPH_OPTIMIZATION[self.graph_optimization]
+        options.execution_mode = EXECUTION_MODE[self.execution_mode]
+        options.enable_cpu_mem_arena = self.cpu_arena
+        options.enable_mem_pattern = self.mem_pattern
+        return options
+
+
+def quantized_path(model_file: str, directory: str) -> str:
+    """Where ml.quantize writes the int8 version of an ONNX model"""
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return os.path.join(directory, f"{stem}.int8.onnx")
 
 
 class ArcFaceModel:
-    def __init__(self, ctx_id=0):
-        self.app = FaceAnalysis(
-            providers=['CPUExecutionProvider', 'CPUExecutionProvider'])
-        self.app.prepare(ctx_id=ctx_id, det_size=(640, 640))
+    embedding_size = 512
+
+    def __init__(self, ctx_id=0, intra_op_threads=None, det_size=640,
+                 session: Optional[SessionConfig] = None, quantized_dir: Optional[str] = None):
+        """
+        session: ONNX Runtime options (intra_op_threads overrides its thread
+        counts, e.g. with a process pinned to a CPU share)
+        quantized_dir: load <model>.int8.onnx from here instead of the fp32
+        model wherever one exists
+        """
+        self.det_size = det_size
+        self.session = session or SessionConfig()
+        if intra_op_threads:
+            self.session = replace(self.session, intra_op_threads=intra_op_threads,
+                                   recognition_intra_op_threads=None)
+        # Landmark and gender/age models are never used, so never loaded
+        self.app = FaceAnalysis(allowed_modules=['detection', 'recognition'],
+                                providers=['CPUExecutionProvider', 'CPUExecutionProvider'])
+        model_files = {}
+        if quantized_dir:
+            for task, model in self.app.models.items():
+                path = quantized_path(model.model_file, quantized_dir)
+                if os.path.exists(path):
+                    model_files[task] = path
+        if self.session != SessionConfig() or model_files:
+            self._rebuild_sessions(self.session, model_files)
+        self.quantized = sorted(model_files)
+        self.app.prepare(ctx_id=ctx_id, det_size=(det_size, det_size))
+        self.det_model = self.app.det_model
+        self.rec_model = self.app.models['recognition']
+
+    def _rebuild_sessions(self, session: SessionConfig, model_files):
+        """
+        Recreate each ONNX session with our options, from model_files[task]
+        where given (FaceAnalysis does not forward session options)
+        """
+        for task, model in self.app.models.items():
+            path = model_files.get(task, model.model_file)
+            model.session = onnxruntime.InferenceSession(
+                path, sess_options=session.options(task), providers=model.session.get_providers())
+            model.model_file = path
+
+    def detect(self, frame, det_size=None):
+        """
+        Run only the RetinaFace detector on a frame, at det_size x det_size
+        input (default: the size the model was prepared with)
+        Returns: (N, 5) boxes with score column and (N, 5, 2) landmarks
+        """
+        size = det_size or self.det_size
+        bboxes, kpss = self.det_model.detect(
+            frame, input_size=(size, size), max_num=0, metric='default')
+        if kpss is None:
+            kpss = np.empty((0, 5, 2), dtype=np.float32)
+        return bboxes, kpss
+
+    def align(self, frame, landmarks):
+        """Crop and align each face by its 5-point landmarks"""
+        image_size = self.rec_model.input_size[0]
+        return [face_align.norm_crop(frame, landmark=kps, image_size=image_size)
+                for kps in landmarks]
+
+    def check_aligned(self, crops):
+        """Validate crops that are already aligned at the recognition input size"""
+        size = tuple(self.rec_model.input_size)
+        for crop in crops:
+            if crop.ndim != 3 or crop.shape[2] != 3 or (crop.shape[1], crop.shape[0]) != size:
+                raise ValueError(
+                    f"Aligned face must be a {size[0]}x{size[1]} BGR crop, got {crop.shape}")
+        return list(crops)
+
+    def embed_aligned(self, crops):
+        """
+        Embed already aligned face crops, skipping detection and alignment
+        Returns: (N, 512) numpy array of embeddings
+        """
+        crops = self.check_aligned(crops)
+        if not crops:
+            return np.empty((0, self.embedding_size), dtype=np.float32)
+        return self.rec_model.get_feat(crops)
+
+    def get_embeddings(self, frame, landmarks):
+        """
+        Align each face by its 5-point landmarks and embed all crops
+        in a single recognition call
+        Returns: (N, 512) numpy array of embeddings
+        """
+        if len(landmarks) == 0:
+            return np.empty((0, self.embedding_size), dtype=np.float32)
+        return self.rec_model.get_feat(self.align(frame, landmarks))
+
+    def get_faces(self, frame, det_size=None):
+        """
+        Detect and embed every face in a frame
+        Returns: (N, 5) boxes with score column, (N, 5, 2) landmarks and
+        (N, 512) embeddings, best detection score first
+        """
+        bboxes, kpss = self.detect(frame, det_size)
+        return bboxes, kpss, self.get_embeddings(frame, kpss)
 
-    def get_embedding_from_frame(self, frame):
+    def get_embedding_from_frame(self, frame, cache=None, cache_key=None):
         """
         Extract facial embedding from a frame/image
-        Returns: numpy array of embedding or None if no face detected
+        cache, cache_key: a get/put cache and the caller's key for this frame
+        and model setup; identical frames are then embedded only once
+        Returns: embedding of the highest-scoring face, or None if no face detected
         """
         try:
-            faces = self.app.get(frame)
-            if len(faces) > 0:
-                return faces[0].embedding
+            use_cache = cache is not None and cache_key is not None
+            cached = cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                embeddings = cached["embeddings"]
+            else:
+                _, _, embeddings = self.get_faces(frame)
+                if use_cache:
+                    cache.put(cache_key, {"embeddings": embeddings})
+            if len(embeddings) > 0:
+                return embeddings[0]
             return None
         except Exception as e:
             print(f"Error extracting embedding: {e}")
@@ -3,6 +3,7 @@ import { useEffect, useRef, useState } from "react";
 import axios from "axios";
 import { useParams, useRouter } from "next/navigation";
 import { Button } from "@/components/ui/button";
+import { encodeFrame } from "../../../lib/frame";
 
 import {
   Camera,
@@ -121,12 +122,21 @@ export default function SearchDetailPage() {
         return;
       }
 
+      ws.binaryType = "arraybuffer";
+      let seq = 0;
+
       intervalRef.current = setInterval(() => {
         if (!videoRef.current || ws.readyState !== WebSocket.OPEN) return;
 
         context.drawImage(videoRef.current, 0, 0, canvas.width, canvas.height);
-        const dataUrl = canvas.toDataURL("image/jpeg");
-        ws.send(JSON.stringify({ frame: dataUrl }));
+        canvas.toBlob(
+          async (blob) => {
+            if (!blob || ws.readyState !== WebSocket.OPEN) return;
+            ws.send(await encodeFrame(blob, seq++));
+          },
+          "image/jpeg",
+          0.8
+        );
       }, 500);
     } catch (err) {
       console.error("Camera error", err);
@@ -10,21 +10,30 @@ export interface Person {
   phone_number: string;
   last_seen_location: string;
   add_info: string;
+  // URL of the photo (or its thumbnail in list responses)
   img: string;
-  embedding?: number[];
 }
 
 export interface ApiResponse<T> {
   persons?: T[];
   status?: string;
   person?: T;
+  next?: string | null;
 }
 
-// Get all persons from the API
+// Get all persons from the API, following the pagination cursor
 export const fetchAllPersons = async (): Promise<Person[]> => {
   try {
-    const response = await axios.get<ApiResponse<Person>>(`${API_URL}/people`);
-    return response.data.persons || [];
+    const persons: Person[] = [];
+    let after: string | null | undefined = undefined;
+    do {
+      const response: { data: ApiResponse<Person> } = await axios.get<
+        ApiResponse<Person>
+      >(`${API_URL}/people`, { params: { limit: 200, after } });
+      persons.push(...(response.data.persons || []));
+      after = response.data.next;
+    } while (after);
+    return persons;
   } catch (error) {
     console.error("Error fetching persons:", error);
     throw error;
@@ -0,0 +1,21 @@
+// Binary WebSocket frame: 16-byte little-endian header followed by JPEG bytes.
+// Must match FRAME_HEADER in backend/ml/frames.py.
+//   uint32 seq | float64 timestamp (ms) | uint16 width hint | uint16 height hint
+export const FRAME_HEADER_SIZE = 16;
+
+export const encodeFrame = async (
+  jpeg: Blob,
+  seq: number,
+  width = 0,
+  height = 0
+): Promise<ArrayBuffer> => {
+  const body = new Uint8Array(await jpeg.arrayBuffer());
+  const buffer = new ArrayBuffer(FRAME_HEADER_SIZE + body.byteLength);
+  const view = new DataView(buffer);
+  view.setUint32(0, seq >>> 0, true);
+  view.setFloat64(4, Date.now(), true);
+  view.setUint16(12, width, true);
+  view.setUint16(14, height, true);
+  new Uint8Array(buffer, FRAME_HEADER_SIZE).set(body);
+  return buffer;
+};